@@ -1,10 +1,20 @@
+import random
+import time
 from smtplib import SMTPDataError
 
+from django.core.cache import cache
 from django.core.mail import send_mail
+from django.db.models import Max, Min, Value
+from django.db.models.functions import Concat, Left
 
 from blog.models import Article
 from django.conf import settings
 
+ARTICLE_POOL_KEY = "blog_article_pool"
+ARTICLE_POOL_LOCK_KEY = "blog_article_pool_lock"
+# random pk ranges read to sample article ids
+ARTICLE_SAMPLE_WINDOWS = 5
+
 
 def send_congratulatory_mail(article: Article):
     subject = "SkyStore - статья пользуется популярностью!"
@@ -16,3 +26,72 @@ def send_congratulatory_mail(article: Article):
         send_mail(subject, body, from_email=from_email, recipient_list=recipient_list)
     except SMTPDataError as ex:
         print(f"Ошибка отправки письма:\n{ex}")
+
+
+def sample_article_ids(size: int):
+    """
+    Up to `size` random published article ids. A few pk ranges are read from random
+    starting points on the primary key index, the cost does not grow with the number of articles.
+    """
+    published = Article.objects.filter(is_published=True).order_by("pk")
+    bounds = published.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+
+    windows = min(size, ARTICLE_SAMPLE_WINDOWS)
+    window_size = -(-size // windows)
+    article_ids = set()
+    for _ in range(windows):
+        start = random.randint(bounds["low"], bounds["high"])
+        window = list(published.filter(pk__gte=start).values_list("pk", flat=True)[:window_size])
+        if len(window) < window_size:
+            # wrap around to the beginning of the pk range
+            window += published.filter(pk__lt=start).values_list("pk", flat=True)[:window_size - len(window)]
+        article_ids.update(window)
+    return random.sample(sorted(article_ids), min(size, len(article_ids)))
+
+
+def build_article_pool(size: int):
+    """Up to `size` random published articles with only the fields the index page shows."""
+    article_ids = sample_article_ids(size)
+
+    return list(
+        Article.objects.filter(pk__in=article_ids)
+        .annotate(
+            # one char more than the template shows, so truncatechars still adds the ellipsis
+            excerpt=Left("content", 101),
+            author_name=Concat("author__first_name", Value(" "), "author__last_name"),
+        )
+        .values("pk", "title", "preview", "created_at", "excerpt", "author_name")
+    )
+
+
+def refresh_article_pool():
+    articles = build_article_pool(settings.BLOG_ARTICLE_POOL_SIZE)
+    pool = {"articles": articles, "fresh_until": time.time() + settings.BLOG_ARTICLE_POOL_TIMEOUT}
+    # kept without timeout, a stale pool is served while another request rebuilds it
+    cache.set(ARTICLE_POOL_KEY, pool, None)
+    return articles
+
+
+def get_article_pool():
+    pool = cache.get(ARTICLE_POOL_KEY)
+    if pool is not None and pool["fresh_until"] > time.time():
+        return pool["articles"]
+
+    # only the request which takes the lock rebuilds the pool
+    if cache.add(ARTICLE_POOL_LOCK_KEY, True, settings.BLOG_ARTICLE_POOL_LOCK_TIMEOUT):
+        try:
+            return refresh_article_pool()
+        finally:
+            cache.delete(ARTICLE_POOL_LOCK_KEY)
+
+    return pool["articles"] if pool is not None else []
+
+
+def get_random_articles(count: int):
+    if settings.CACHE_ENABLED:
+        pool = get_article_pool()
+    else:
+        pool = build_article_pool(count)
+    return random.sample(pool, min(count, len(pool)))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Article
+from .services import refresh_article_pool
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, update_fields=None, **kwargs):
+    # a view of the article only updates its counter
+    if update_fields and set(update_fields) <= {"views_count"}:
+        return
+    if settings.CACHE_ENABLED:
+        refresh_article_pool()
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    if settings.CACHE_ENABLED:
+        refresh_article_pool()
@@ -73,5 +73,5 @@ class ArticleDetailView(LoginRequiredMixin, DetailView):
             if self.object.author:
                 send_congratulatory_mail(self.object)
 
-        self.object.save()
+        self.object.save(update_fields=["views_count"])
         return self.object
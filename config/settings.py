@@ -128,9 +128,91 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 SERVER_EMAIL = EMAIL_HOST_USER
 EMAIL_ADMIN = EMAIL_HOST_USER
 
-CRONJOBS = [
-    ('*/1 * * * *', 'mailings.tasks.check_mailing_list'),
-]
+# Emails sent through one SMTP connection before it is reopened
+MAILING_MESSAGES_PER_CONNECTION = 100
+# Threads sending one mailing, can be overridden by Mailing.workers
+MAILING_DISPATCH_WORKERS = 4
+# Due recipients are read and checkpointed by chunks
+MAILING_DISPATCH_CHUNK_SIZE = 5000
+# Lease of a tick on a mailing, renewed by a heartbeat
+MAILING_LEASE_SECONDS = 120
+# SMTP transactions in flight for AsyncMailService
+MAILING_ASYNC_CONCURRENCY = 200
+# MailingLog rows are saved by batches or every N seconds
+MAILING_LOG_BATCH_SIZE = 500
+MAILING_LOG_FLUSH_INTERVAL = 5
+# MailingLog rows older than N days (and than the longest period) are rolled up
+# into MailingLogRollup and deleted by purge_mailing_logs, in batches of N rows
+MAILING_LOG_RETENTION_DAYS = 90
+MAILING_LOG_PURGE_BATCH_SIZE = 1000
+# Mailing messages kept rendered in memory
+MAILING_MESSAGE_CACHE_SIZE = 128
+# Compiled personalization templates kept in memory
+MAILING_TEMPLATE_CACHE_SIZE = 256
+# Encoded personalized headers (subjects) kept in memory
+MAILING_HEADER_CACHE_SIZE = 4096
+# Retries of failed deliveries: (first delay in seconds, backoff factor, max attempts)
+# by the smtplib error class name, None means the error is not retried.
+# 'failed' is used when the backend accepted nothing without an error.
+# SMTPRecipientsRefused applies to 4xx refusals (greylisting, mailbox busy), 5xx ones are final.
+MAILING_RETRY_POLICY = {
+    'SMTPServerDisconnected': (60, 2, 6),
+    'SMTPConnectError': (120, 2, 6),
+    'SMTPRecipientsRefused': (300, 2, 5),
+    'SMTPSenderRefused': (600, 2, 3),
+    'SMTPDataError': (300, 2, 3),
+    'SMTPResponseException': (300, 2, 4),
+    'TimeoutError': (120, 2, 5),
+    # the message could not be built for the recipient, e.g. an invalid header
+    'ValueError': None,
+    'failed': (300, 2, 3),
+    'default': (300, 2, 3),
+}
+# Retries sent in a tick: MAILING_RETRY_SHARE of the first-time sends, within the min/max bounds
+MAILING_RETRY_SHARE = 0.2
+MAILING_RETRY_MIN_PER_TICK = 100
+MAILING_RETRY_MAX_PER_TICK = 5000
+# mailings.backends.SimulatedEmailBackend, used by bench_dispatch
+MAILING_SIMULATED_LATENCY = 0.01
+MAILING_SIMULATED_FAILURE_RATE = 0.01
+# Max seconds run_dispatcher sleeps before reloading the schedule
+MAILING_DISPATCHER_REFRESH = 60
+# Min seconds between two ticks of run_dispatcher
+MAILING_DISPATCHER_MIN_INTERVAL = 1
+# Token buckets as (emails per second, burst), None means no limit.
+# A domain answering 421/45x is paused for throttle_penalty seconds.
+# The buckets are kept per process: with N dispatcher and outbox worker processes
+# divide the limits by N.
+MAILING_RATE_LIMITS = {
+    'relay': (50, 100),
+    'default_domain': (10, 20),
+    'domains': {
+        'gmail.com': (20, 40),
+        'yandex.ru': (20, 40),
+        'mail.ru': (20, 40),
+    },
+    'throttle_penalty': 60,
+}
+# Put due recipients into the outbox for run_outbox_worker instead of sending in the tick
+MAILING_USE_OUTBOX = env.bool('MAILING_USE_OUTBOX', default=False)
+MAILING_OUTBOX_BATCH_SIZE = 200
+MAILING_OUTBOX_LEASE_SECONDS = 300
+MAILING_OUTBOX_POLL_INTERVAL = 5
+MAILING_OUTBOX_KEEP_DONE = 7
+# Rows per transaction of the CSV client import and the number of row errors kept in the report
+MAILING_IMPORT_BATCH_SIZE = 1000
+MAILING_IMPORT_MAX_ERRORS = 100
+# Rows fetched per database round trip by the mailing logs export
+MAILING_EXPORT_CHUNK_SIZE = 2000
+# Rows per page of the mailing logs list
+MAILING_LOG_PAGE_SIZE = 50
+# Rows per page of the mailings list
+MAILING_LIST_PAGE_SIZE = 25
+# Seconds the index page counters are cached, they are also dropped on changes
+MAILING_DASHBOARD_CACHE_TIMEOUT = 300
+
+# Mailings are sent by the resident `manage.py run_dispatcher` process
+CRONJOBS = []
 
 CRONTAB_DJANGO_SETTINGS = 'config.settings'
 CRONTAB_COMMAND_SUFFIX = "2>&1"
@@ -142,7 +224,7 @@ LOGOUT_REDIRECT_URL = '/'
 
 LOGIN_URL = reverse_lazy('users:login')
 
-CACHE_ENABLED = env('CACHE_ENABLED')
+CACHE_ENABLED = env.bool('CACHE_ENABLED', default=False)
 
 if CACHE_ENABLED:
     CACHES = {
@@ -150,4 +232,12 @@ if CACHE_ENABLED:
             "BACKEND": env('CACHE_BACKEND'),
             "LOCATION": env('CACHE_LOCATION'),
         }
-    }
\ No newline at end of file
+    }
+
+# Random news of the index page are sampled from a cached pool of published articles:
+# pool size, seconds before the pool is rebuilt, seconds the rebuild lock is held at most
+BLOG_ARTICLE_POOL_SIZE = 50
+BLOG_ARTICLE_POOL_TIMEOUT = 600
+BLOG_ARTICLE_POOL_LOCK_TIMEOUT = 30
+# Seconds the group names of a user are cached, changes of user groups outdate them at once
+USERS_GROUPS_CACHE_TIMEOUT = 3600
@@ -1,6 +1,18 @@
 from django.contrib import admin
 
-from .models import Client, Periods, Mailing, Audience, MailingLog
+from .models import (
+    Client,
+    Periods,
+    Mailing,
+    Audience,
+    MailingLog,
+    OutboxItem,
+    DeliveryRetry,
+    MailingLease,
+    MailingLogRollup,
+    MailingStats,
+    ReachedRecipient,
+)
 
 
 @admin.register(Client)
@@ -31,3 +43,68 @@ class MailingLogAdmin(admin.ModelAdmin):
         'client',
         'status',
     )
+
+
+@admin.register(OutboxItem)
+class OutboxItemAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'client',
+        'status',
+        'worker',
+        'lease_until',
+        'attempts',
+        'is_retry',
+    )
+
+
+@admin.register(DeliveryRetry)
+class DeliveryRetryAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'client',
+        'attempts',
+        'next_retry_at',
+        'error_class',
+    )
+
+
+@admin.register(MailingLease)
+class MailingLeaseAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'owner',
+        'expires_at',
+        'checkpoint',
+    )
+
+
+@admin.register(MailingLogRollup)
+class MailingLogRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'date',
+        'status',
+        'count',
+    )
+
+
+@admin.register(MailingStats)
+class MailingStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'success_count',
+        'fail_count',
+        'error_count',
+        'recipients_count',
+        'last_send_time',
+    )
+
+
+@admin.register(ReachedRecipient)
+class ReachedRecipientAdmin(admin.ModelAdmin):
+    list_display = (
+        'mailing',
+        'client',
+        'time',
+    )
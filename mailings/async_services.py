@@ -0,0 +1,204 @@
+import asyncio
+import logging
+from smtplib import SMTPException
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail.message import sanitize_address
+from django.utils import timezone
+
+from .async_smtp import AsyncSMTPConnection
+from .messages import Recipient, get_prepared_message
+from .models import Mailing, MailingLog
+from .rate_limits import ThrottledRecipients, get_rate_limiter, get_smtp_code
+from .services import MailService, MailingLock, MailingLogWriter
+
+
+class AsyncSMTPPool:
+    """
+    Pool of idle asyncio SMTP connections.
+    A connection is reopened after MAILING_MESSAGES_PER_CONNECTION
+    messages or after a sending error.
+    """
+
+    def __init__(self, max_messages: int = None):
+        self.max_messages = max_messages or settings.MAILING_MESSAGES_PER_CONNECTION
+        self.idle = []
+
+    @staticmethod
+    def new_connection():
+        return AsyncSMTPConnection(
+            host=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER,
+            password=settings.EMAIL_HOST_PASSWORD,
+            use_ssl=settings.EMAIL_USE_SSL,
+            use_tls=getattr(settings, "EMAIL_USE_TLS", False),
+            timeout=getattr(settings, "EMAIL_TIMEOUT", None),
+        )
+
+    async def acquire(self):
+        if self.idle:
+            return self.idle.pop()
+        connection = self.new_connection()
+        try:
+            await connection.open()
+        except BaseException:
+            # a failed greeting, EHLO, STARTTLS or AUTH leaves the socket open
+            await connection.close()
+            raise
+        return connection
+
+    async def release(self, connection: AsyncSMTPConnection, broken=False):
+        if broken or connection.sent_count >= self.max_messages:
+            await connection.close()
+        else:
+            self.idle.append(connection)
+
+    async def close(self):
+        while self.idle:
+            await self.idle.pop().close()
+
+
+class AsyncMailService:
+    """
+    Asyncio dispatch engine working alongside MailService.
+    Keeps up to MAILING_ASYNC_CONCURRENCY SMTP transactions in flight,
+    ORM work goes through batched sync_to_async calls.
+    """
+
+    def __init__(self, concurrency: int = None, log_batch_size: int = None):
+        self.concurrency = concurrency or settings.MAILING_ASYNC_CONCURRENCY
+        self.log_batch_size = log_batch_size or settings.MAILING_LOG_BATCH_SIZE
+        self.sync_service = MailService()
+
+    @staticmethod
+    def build_message(mailing: Mailing, recipient: Recipient):
+        prepared = get_prepared_message(mailing)
+        recipients = [sanitize_address(recipient.email, prepared.encoding)]
+        message = prepared.render(recipient).as_bytes(linesep="\r\n")
+        return prepared.envelope_from, recipients, message
+
+    async def send_one_email(self, mailing: Mailing, recipient: Recipient, pool: AsyncSMTPPool):
+        connection = None
+        error_class = None
+        smtp_code = None
+        error_message = None
+        status = MailingLog.STATUS_ERROR
+        try:
+            from_email, recipients, message = self.build_message(mailing, recipient)
+            connection = await pool.acquire()
+            result = await connection.send(from_email, recipients, message)
+        except (SMTPException, OSError, asyncio.TimeoutError) as ex:
+            if connection is not None:
+                await pool.release(connection, broken=True)
+            get_rate_limiter().report_error(recipient.email, ex)
+            error_class = ex.__class__
+            smtp_code = get_smtp_code(ex)
+            error_message = (str(ex) or ex.__class__.__name__)[:250]
+        except ValueError as ex:
+            # the message can not be built for this recipient, the other sends go on
+            if connection is not None:
+                await pool.release(connection)
+            error_class = ex.__class__
+            error_message = str(ex)[:250]
+        else:
+            await pool.release(connection)
+            status = MailingLog.STATUS_SUCCESS if result else MailingLog.STATUS_FAILED
+
+        log_obj = MailingLog(
+            client_id=recipient.id,
+            mailing=mailing,
+            status=status,
+            error_message=error_message,
+        )
+        log_obj.error_class = error_class
+        log_obj.smtp_code = smtp_code
+        return log_obj
+
+    async def save_logs(self, logs: list):
+        if logs:
+            await sync_to_async(MailingLogWriter.save_logs)(logs)
+
+    async def process_mailing(self, mailing: Mailing):
+        """Sends the due recipients, then the due retries, like MailService.process_mailing."""
+        started = timezone.now()
+        lock = MailingLock(mailing)
+        if not await sync_to_async(lock.acquire)():
+            logging.info(f"{mailing} is processed by another tick")
+            return
+        try:
+            first_sends_count = 0
+            while not lock.lost.is_set():
+                recipients = await sync_to_async(self.sync_service.get_due_recipients)(
+                    mailing, after=lock.checkpoint, limit=settings.MAILING_DISPATCH_CHUNK_SIZE
+                )
+                if not recipients:
+                    break
+                await self.send_recipients(mailing, recipients, lock)
+                first_sends_count += len(recipients)
+                await sync_to_async(lock.save_checkpoint)(recipients[-1].id)
+
+            if lock.lost.is_set():
+                return
+            await sync_to_async(lock.save_checkpoint)(None)
+
+            # retries go after the first-time sends
+            retries = await sync_to_async(self.sync_service.get_retry_recipients)(
+                mailing, first_sends_count, started
+            )
+            await self.send_recipients(mailing, retries, lock)
+        finally:
+            await sync_to_async(lock.release)()
+
+    async def send_recipients(self, mailing: Mailing, recipients: list, lock: MailingLock = None):
+        """Sends the recipients, no new one is polled once the lease of the mailing is lost."""
+        if not recipients:
+            return
+        recipients = ThrottledRecipients(recipients)
+
+        pool = AsyncSMTPPool()
+        semaphore = asyncio.BoundedSemaphore(self.concurrency)
+        logs = []
+        tasks = set()
+
+        async def send(recipient):
+            try:
+                logs.append(await self.send_one_email(mailing, recipient, pool))
+            finally:
+                semaphore.release()
+
+        try:
+            while lock is None or not lock.lost.is_set():
+                try:
+                    recipient, wait = recipients.poll()
+                except StopIteration:
+                    break
+                if recipient is None:
+                    await asyncio.sleep(wait)
+                    continue
+
+                await semaphore.acquire()
+                task = asyncio.create_task(send(recipient))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+                if len(logs) >= self.log_batch_size:
+                    batch, logs[:] = logs[:], []
+                    await self.save_logs(batch)
+
+            await asyncio.gather(*tasks)
+        finally:
+            await self.save_logs(logs)
+            await pool.close()
+
+        logging.info(f"rate limits: {get_rate_limiter().snapshot()}")
+
+    async def process_mailing_list(self):
+        await sync_to_async(self.sync_service.update_statuses)()
+
+        mailings = await sync_to_async(list)(self.sync_service.get_started_mailings())
+        logging.info(f"mailings: {mailings}")
+
+        for mailing in mailings:
+            await self.process_mailing(mailing)
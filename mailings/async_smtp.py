@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import ssl
+import threading
+from smtplib import (
+    SMTPDataError,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPSenderRefused,
+    SMTPServerDisconnected,
+)
+
+
+class AsyncSMTPConnection:
+    """
+    Minimal asyncio SMTP client.
+    Supports SSL/STARTTLS, AUTH PLAIN and several messages per connection.
+    Errors are raised as smtplib exceptions, so callers can handle them
+    the same way as with the django smtp backend.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_ssl=False, use_tls=False, timeout=None):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.sent_count = 0
+
+    async def _read_reply(self):
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b"-":
+                return int(line[:3]), b"\n".join(lines)
+
+    async def command(self, line: str):
+        self.writer.write(line.encode() + b"\r\n")
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _expect(self, line: str, expected_code: int):
+        code, message = await self.command(line)
+        if code != expected_code:
+            raise SMTPResponseException(code, message)
+
+    async def open(self):
+        ssl_context = ssl.create_default_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context), self.timeout
+        )
+
+        code, message = await self._read_reply()
+        if code != 220:
+            raise SMTPResponseException(code, message)
+        await self._expect("EHLO localhost", 250)
+
+        if self.use_tls:
+            await self._expect("STARTTLS", 220)
+            await self.writer.start_tls(ssl.create_default_context())
+            await self._expect("EHLO localhost", 250)
+
+        if self.username:
+            credentials = f"\0{self.username}\0{self.password}".encode()
+            await self._expect(f"AUTH PLAIN {base64.b64encode(credentials).decode()}", 235)
+
+    async def send(self, from_email: str, recipients: list, message: bytes):
+        code, response = await self.command(f"MAIL FROM:<{from_email}>")
+        if code != 250:
+            await self.command("RSET")
+            raise SMTPSenderRefused(code, response, from_email)
+
+        refused = {}
+        for recipient in recipients:
+            code, response = await self.command(f"RCPT TO:<{recipient}>")
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            await self.command("RSET")
+            raise SMTPRecipientsRefused(refused)
+
+        code, response = await self.command("DATA")
+        if code != 354:
+            await self.command("RSET")
+            raise SMTPDataError(code, response)
+
+        data = message.replace(b"\r\n.", b"\r\n..")
+        if data.startswith(b"."):
+            data = b"." + data
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        self.writer.write(data + b".\r\n")
+        await self.writer.drain()
+
+        code, response = await self._read_reply()
+        if code != 250:
+            raise SMTPDataError(code, response)
+
+        self.sent_count += 1
+        return len(recipients) - len(refused)
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            await self.command("QUIT")
+        except (OSError, SMTPServerDisconnected, asyncio.TimeoutError):
+            pass
+        finally:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+class SMTPSink:
+    """
+    Local asyncio SMTP server which accepts and counts every message.
+    Used to check and benchmark dispatch engines without a real relay.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.received_count = 0
+        self.server = None
+        self.loop = None
+        self.thread = None
+
+    async def handle(self, reader, writer):
+        writer.write(b"220 sink ready\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            verb = line[:4].upper()
+
+            if verb == b"DATA":
+                writer.write(b"354 end data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                self.received_count += 1
+                writer.write(b"250 accepted\r\n")
+            elif verb == b"QUIT":
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                break
+            elif verb == b"AUTH":
+                writer.write(b"235 authenticated\r\n")
+            elif verb in (b"EHLO", b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                writer.write(b"250 ok\r\n")
+            else:
+                writer.write(b"502 command not implemented\r\n")
+            await writer.drain()
+
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def start_in_thread(self):
+        """Runs the sink in its own event loop, so sync code can send to it."""
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
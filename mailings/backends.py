@@ -0,0 +1,46 @@
+import random
+import threading
+import time
+from smtplib import SMTPDataError
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+class SimulatedEmailBackend(BaseEmailBackend):
+    """
+    Email backend for benchmarks: waits MAILING_SIMULATED_LATENCY seconds per message
+    and fails MAILING_SIMULATED_FAILURE_RATE of the messages with SMTPDataError.
+    Send latencies are collected in `latencies` for the statistics.
+    """
+
+    latencies = []
+    lock = threading.Lock()
+
+    def __init__(self, latency: float = None, failure_rate: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = settings.MAILING_SIMULATED_LATENCY if latency is None else latency
+        self.failure_rate = settings.MAILING_SIMULATED_FAILURE_RATE if failure_rate is None else failure_rate
+
+    @classmethod
+    def reset_stats(cls):
+        with cls.lock:
+            cls.latencies = []
+
+    def send_messages(self, email_messages):
+        sent_count = 0
+        for message in email_messages:
+            started = time.perf_counter()
+            message.message().as_bytes(linesep="\r\n")
+            if self.latency:
+                time.sleep(self.latency)
+            failed = random.random() < self.failure_rate
+            with self.lock:
+                self.latencies.append(time.perf_counter() - started)
+
+            if failed:
+                if not self.fail_silently:
+                    raise SMTPDataError(554, b"simulated failure")
+                continue
+            sent_count += 1
+        return sent_count
@@ -1,6 +1,9 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.utils import timezone
 
-from mailings.models import Audience, Client
+from mailings.models import Audience, Client, MailingLog
 
 
 class AudienceForm(forms.ModelForm):
@@ -11,3 +14,65 @@ class AudienceForm(forms.ModelForm):
     def __init__(self, user, *args, **kwargs):
         super(AudienceForm, self).__init__(*args, **kwargs)
         self.fields["recipients"].queryset = Client.objects.filter(creator=user)
+
+
+class ClientForm(forms.ModelForm):
+    class Meta:
+        model = Client
+        fields = ("first_name", "last_name", "email", "note")
+
+    def __init__(self, user, *args, **kwargs):
+        super(ClientForm, self).__init__(*args, **kwargs)
+        self.user = user
+        # Client.clean() checks the email among the clients of the creator
+        if self.instance.creator_id is None:
+            self.instance.creator = user
+
+
+class ClientImportForm(forms.Form):
+    file = forms.FileField(label="CSV файл", help_text="Колонки: email, first_name, last_name, note")
+    audience = forms.ModelChoiceField(queryset=Audience.objects.none(), label="Добавить в аудиторию", required=False)
+
+    def __init__(self, user, *args, **kwargs):
+        super(ClientImportForm, self).__init__(*args, **kwargs)
+        self.fields["audience"].queryset = Audience.objects.filter(creator=user)
+
+
+class MailingLogFilterForm(forms.Form):
+    """Filters of mailing logs, bound to GET parameters."""
+
+    mailing = forms.ModelChoiceField(
+        queryset=None, label="Рассылка", required=False, empty_label="Все",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    status = forms.ChoiceField(
+        choices=(("", "Все"), *MailingLog.STATUSES), label="Статус", required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    date_from = forms.DateField(
+        label="С", required=False, widget=forms.DateInput(attrs={"type": "date", "class": "form-control"})
+    )
+    date_to = forms.DateField(
+        label="По", required=False, widget=forms.DateInput(attrs={"type": "date", "class": "form-control"})
+    )
+
+    def __init__(self, mailings, *args, **kwargs):
+        super(MailingLogFilterForm, self).__init__(*args, **kwargs)
+        self.fields["mailing"].queryset = mailings
+
+    @staticmethod
+    def start_of_day(date):
+        return timezone.make_aware(datetime.combine(date, time.min))
+
+    def filter_queryset(self, queryset):
+        """Must be called after is_valid(). Dates are compared as a range of the time column."""
+        data = self.cleaned_data
+        if data["mailing"]:
+            queryset = queryset.filter(mailing=data["mailing"])
+        if data["status"]:
+            queryset = queryset.filter(status=data["status"])
+        if data["date_from"]:
+            queryset = queryset.filter(time__gte=self.start_of_day(data["date_from"]))
+        if data["date_to"]:
+            queryset = queryset.filter(time__lt=self.start_of_day(data["date_to"] + timedelta(days=1)))
+        return queryset
@@ -0,0 +1,190 @@
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db.backends.signals import connection_created
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mailings.backends import SimulatedEmailBackend
+from mailings.models import Audience, Client, Mailing, MailingLog, Periods
+from mailings.rate_limits import reset_rate_limiter
+from mailings.services import MailService
+from users.models import User
+
+BENCH_EMAIL = "bench@example.com"
+SEED_BATCH_SIZE = 5000
+
+
+class QueryCounter:
+    """Counts queries of every DB connection, worker threads included."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.install(connection)
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        connection_created.disconnect(self.install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(share * 100) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispatch throughput benchmark: seeds N clients and a started mailing, runs "
+        "process_mailing_list against SimulatedEmailBackend and reports throughput, "
+        "query count, per-send latency and peak memory as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Recipients counts, comma separated")
+        parser.add_argument("--latency", type=float, default=0.01, help="Simulated send latency, seconds")
+        parser.add_argument("--failure-rate", type=float, default=0.01, help="Share of failed sends")
+        parser.add_argument("--workers", type=int, default=None, help="Sending threads, MAILING_DISPATCH_WORKERS by default")
+        parser.add_argument("--rate-limits", action="store_true", help="Keep MAILING_RATE_LIMITS, off by default")
+        parser.add_argument("--output", default=None, help="JSON file for the results")
+        parser.add_argument("--keep", action="store_true", help="Do not delete the seeded data")
+
+    @staticmethod
+    def seed(size: int):
+        user, _ = User.objects.get_or_create(email=BENCH_EMAIL, defaults={"first_name": "Bench"})
+        period, _ = Periods.objects.get_or_create(duration=timedelta(days=1), defaults={"name": "Benchmark"})
+        audience = Audience.objects.create(name=f"Benchmark {size}", creator=user)
+
+        through = Audience.recipients.through
+        for start in range(0, size, SEED_BATCH_SIZE):
+            clients = Client.objects.bulk_create([
+                Client(
+                    first_name=f"Client{number}",
+                    last_name="Benchmark",
+                    email=f"client{number}.{audience.pk}@domain{number % 50}.example.com",
+                    creator=user,
+                )
+                for number in range(start, min(start + SEED_BATCH_SIZE, size))
+            ])
+            through.objects.bulk_create([through(audience=audience, client=client) for client in clients])
+
+        now = timezone.now()
+        return Mailing.objects.create(
+            name=f"Benchmark {size}",
+            status=Mailing.STATUS_CREATED,
+            period=period,
+            audience=audience,
+            start_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(days=1),
+            message_title="Специальное предложение, {{ first_name }}",
+            message_body="Здравствуйте, {{ full_name }}!\nМы подготовили для вас подборку товаров.\n",
+            creator=user,
+        )
+
+    @staticmethod
+    def cleanup(mailing: Mailing):
+        audience = mailing.audience
+        Client.objects.filter(audience=audience).delete()
+        mailing.delete()
+        audience.delete()
+
+    def run(self, size: int, options: dict):
+        mailing = self.seed(size)
+        SimulatedEmailBackend.reset_stats()
+        reset_rate_limiter()
+
+        tracemalloc.start()
+        with QueryCounter() as counter:
+            started = time.perf_counter()
+            MailService().process_mailing_list()
+            elapsed = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        statuses = dict(
+            MailingLog.objects.filter(mailing=mailing).values_list("status").annotate(count=Count("id"))
+        )
+        latencies = sorted(SimulatedEmailBackend.latencies)
+        if not options["keep"]:
+            self.cleanup(mailing)
+
+        sent_count = sum(statuses.values())
+        return {
+            "recipients": size,
+            "sent": sent_count,
+            "statuses": statuses,
+            "elapsed_s": round(elapsed, 3),
+            "emails_per_minute": round(sent_count / elapsed * 60) if elapsed else None,
+            "queries": counter.count,
+            "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+            "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "peak_memory_mb": round(peak_memory / 1024 / 1024, 2),
+        }
+
+    def handle(self, *args, **options):
+        bench_settings = {
+            "EMAIL_BACKEND": "mailings.backends.SimulatedEmailBackend",
+            "MAILING_SIMULATED_LATENCY": options["latency"],
+            "MAILING_SIMULATED_FAILURE_RATE": options["failure_rate"],
+            "MAILING_USE_OUTBOX": False,
+        }
+        if options["workers"]:
+            bench_settings["MAILING_DISPATCH_WORKERS"] = options["workers"]
+        if not options["rate_limits"]:
+            bench_settings["MAILING_RATE_LIMITS"] = {}
+
+        # other started mailings would be sent by the benchmark tick
+        if Mailing.objects.filter(status=Mailing.STATUS_STARTED).exists():
+            self.stdout.write(self.style.ERROR("Stop started mailings before running the benchmark."))
+            return
+
+        results = []
+        with override_settings(**bench_settings):
+            for size in [int(size) for size in options["sizes"].split(",")]:
+                result = self.run(size, options)
+                results.append(result)
+                self.stdout.write(
+                    f"{size}: {result['emails_per_minute']} emails/min, {result['queries']} queries, "
+                    f"p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, "
+                    f"peak {result['peak_memory_mb']} MB"
+                )
+        reset_rate_limiter()
+
+        report = {
+            "settings": {
+                key: value for key, value in bench_settings.items() if key != "EMAIL_BACKEND"
+            },
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
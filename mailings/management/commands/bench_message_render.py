@@ -0,0 +1,41 @@
+import time
+
+from django.core.management import BaseCommand
+from django.core.mail import EmailMessage
+
+from config.settings import DEFAULT_FROM_EMAIL
+from mailings.messages import PreparedEmailMessage, PreparedMessage, Recipient
+
+SUBJECT = "Специальное предложение для наших клиентов"
+BODY = "Здравствуйте!\n\nМы подготовили для вас новую подборку товаров со скидкой до 50%.\n" * 20
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark: CPU time per message with and without the prepared mailing message"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000, help="Messages to render")
+
+    @staticmethod
+    def measure(render, count):
+        started = time.process_time()
+        for number in range(count):
+            recipient = Recipient(number, f"client{number}@example.com", "Иван", "Петров", None)
+            render(recipient).message().as_bytes(linesep="\r\n")
+        return (time.process_time() - started) / count * 1_000_000
+
+    def handle(self, *args, **options):
+        count = options["count"]
+
+        full_build = self.measure(
+            lambda recipient: EmailMessage(
+                subject=SUBJECT, body=BODY, from_email=DEFAULT_FROM_EMAIL, to=[recipient.email]
+            ),
+            count,
+        )
+        prepared = PreparedMessage(SUBJECT, BODY, DEFAULT_FROM_EMAIL)
+        prepared_build = self.measure(lambda recipient: PreparedEmailMessage(prepared, recipient), count)
+
+        self.stdout.write(f"EmailMessage per recipient: {full_build:.1f} µs CPU per message")
+        self.stdout.write(f"PreparedMessage:            {prepared_build:.1f} µs CPU per message")
+        self.stdout.write(self.style.SUCCESS(f"Saved {full_build - prepared_build:.1f} µs per message"))
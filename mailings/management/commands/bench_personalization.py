@@ -0,0 +1,44 @@
+import time
+
+from django.core.management import BaseCommand
+
+from config.settings import DEFAULT_FROM_EMAIL
+from mailings.messages import PreparedMessage, Recipient
+
+SUBJECT = "{{ first_name }}, специальное предложение для вас"
+BODY = (
+    "Здравствуйте, {{ full_name }}!\n\n"
+    "Мы подготовили для вас новую подборку товаров со скидкой до 50%.\n"
+    "Письмо отправлено на {{ email }}. {{ note }}\n"
+)
+FIRST_NAMES = ("Иван", "Анна", "Сергей", "Мария", "Дмитрий", "Елена", "Алексей", "Ольга", "Андрей", "Наталья")
+LAST_NAMES = ("Иванов", "Петрова", "Смирнов", "Кузнецова", "Попов", "Соколова", "Лебедев", "Козлова")
+
+
+class Command(BaseCommand):
+    help = "Benchmark: render personalized mailing messages and report messages per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1_000_000, help="Messages to render")
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        prepared = PreparedMessage(SUBJECT, BODY, DEFAULT_FROM_EMAIL)
+        recipients = [
+            Recipient(
+                number,
+                f"client{number}@example.com",
+                FIRST_NAMES[number % len(FIRST_NAMES)],
+                LAST_NAMES[number % len(LAST_NAMES)],
+                "Ваш менеджер Анна",
+            )
+            for number in range(min(count, 10_000))
+        ]
+
+        started = time.perf_counter()
+        for number in range(count):
+            prepared.render(recipients[number % len(recipients)]).as_bytes(linesep="\r\n")
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Rendered {count} personalized messages in {elapsed:.2f} s")
+        self.stdout.write(self.style.SUCCESS(f"{count / elapsed:.0f} messages/s"))
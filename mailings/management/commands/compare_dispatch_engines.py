@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+
+from mailings.async_services import AsyncMailService
+from mailings.async_smtp import SMTPSink
+from mailings.models import Mailing, MailingLog
+from mailings.rate_limits import reset_rate_limiter
+from mailings.services import MailService, MailingStatsService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of MailService and AsyncMailService for one mailing "
+        "against a local asyncio SMTP sink. Logs written during the run are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("mailing", type=int, help="Mailing pk")
+        parser.add_argument("--latency", type=float, default=0.05, help="Sink delay per message, seconds")
+        parser.add_argument("--workers", type=int, default=None, help="Threads for MailService")
+        parser.add_argument("--concurrency", type=int, default=None, help="In-flight sends for AsyncMailService")
+        parser.add_argument("--rate-limits", action="store_true", help="Keep MAILING_RATE_LIMITS, off by default")
+
+    @staticmethod
+    def run_engine(mailing: Mailing, run):
+        last_log = MailingLog.objects.order_by("pk").last()
+        last_pk = last_log.pk if last_log else 0
+        # every engine starts with full buckets
+        reset_rate_limiter()
+
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+
+        run_logs = MailingLog.objects.filter(mailing=mailing, pk__gt=last_pk)
+        sent_count = run_logs.filter(status=MailingLog.STATUS_SUCCESS).count()
+        run_logs.delete()
+        MailingStatsService().rebuild([mailing.pk])
+        return sent_count, elapsed
+
+    def handle(self, *args, **options):
+        mailing = Mailing.objects.select_related("period", "audience").get(pk=options["mailing"])
+        if options["workers"]:
+            mailing.workers = options["workers"]
+
+        sink = SMTPSink(latency=options["latency"])
+        sink.start_in_thread()
+
+        sink_settings = {
+            "EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+            "EMAIL_HOST": sink.host,
+            "EMAIL_PORT": sink.port,
+            "EMAIL_HOST_USER": "",
+            "EMAIL_HOST_PASSWORD": "",
+            "EMAIL_USE_SSL": False,
+            "EMAIL_USE_TLS": False,
+        }
+        if not options["rate_limits"]:
+            # otherwise the relay limit is measured, not the engines
+            sink_settings["MAILING_RATE_LIMITS"] = {}
+
+        engines = (
+            ("MailService", lambda: MailService().process_mailing(mailing)),
+            (
+                "AsyncMailService",
+                lambda: asyncio.run(AsyncMailService(options["concurrency"]).process_mailing(mailing)),
+            ),
+        )
+
+        try:
+            with override_settings(**sink_settings):
+                for name, run in engines:
+                    sent_count, elapsed = self.run_engine(mailing, run)
+                    rate = sent_count / elapsed if elapsed else 0
+                    self.stdout.write(f"{name}: {sent_count} emails in {elapsed:.2f} s, {rate:.1f} emails/s")
+        finally:
+            sink.stop_thread()
+            reset_rate_limiter()
+
+        self.stdout.write(self.style.SUCCESS(f"Sink received {sink.received_count} messages"))
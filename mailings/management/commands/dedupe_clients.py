@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from mailings.services import ClientMergeService
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill normalized_email of existing clients and merge clients of one creator "
+        "with the same email, moving audiences and mailing logs to the kept client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the duplicates")
+
+    def handle(self, *args, **options):
+        service = ClientMergeService(batch_size=options["batch_size"])
+
+        if options["dry_run"]:
+            groups = service.get_duplicate_groups()
+            self.stdout.write(f"Emails with duplicates: {len(groups)}")
+            return
+
+        updated_count, merged_count = service.run()
+        self.stdout.write(
+            self.style.SUCCESS(f"Normalized emails updated: {updated_count}, duplicate clients merged: {merged_count}")
+        )
@@ -0,0 +1,51 @@
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+
+from mailings.models import Audience
+from mailings.services import ClientImportService
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Import clients from a CSV file with the columns email, first_name, last_name, note. "
+        "Existing clients of the creator with the same email are updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file")
+        parser.add_argument("--creator", required=True, help="Email of the user who owns the clients")
+        parser.add_argument("--audience", type=int, default=None, help="Audience pk to add the clients to")
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows per transaction")
+        parser.add_argument("--encoding", default="utf-8-sig", help="File encoding")
+
+    def print_progress(self, service: ClientImportService):
+        self.stdout.write(
+            f"rows: {service.rows_count}, imported: {service.imported_count}, errors: {service.errors_count}"
+        )
+
+    def print_error(self, line: int, message: str):
+        self.stderr.write(f"line {line}: {message}")
+
+    def handle(self, *args, **options):
+        try:
+            creator = User.objects.get(email=options["creator"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['creator']} does not exist")
+
+        audience = None
+        if options["audience"]:
+            try:
+                audience = Audience.objects.get(pk=options["audience"], creator=creator)
+            except Audience.DoesNotExist:
+                raise CommandError(f"Audience {options['audience']} of {creator} does not exist")
+
+        service = ClientImportService(creator, audience, batch_size=options["batch_size"])
+
+        with open(options["path"], newline="", encoding=options["encoding"]) as file:
+            try:
+                service.run(file, on_progress=self.print_progress, on_error=self.print_error)
+            except ValidationError as ex:
+                raise CommandError(ex.message)
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {service.imported_count} clients"))
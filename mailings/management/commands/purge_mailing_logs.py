@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from mailings.services import MailingLogRetentionService
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll mailing logs older than MAILING_LOG_RETENTION_DAYS (and the longest period) "
+        "up into daily rollups and delete them in small batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Retention in days")
+        parser.add_argument("--batch-size", type=int, default=None, help="Logs per transaction")
+        parser.add_argument("--pause", type=float, default=0, help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        service = MailingLogRetentionService(options["days"], options["batch_size"])
+        purged_count = service.purge(
+            pause=options["pause"],
+            on_progress=lambda count: self.stdout.write(f"purged: {count}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged_count} mailing logs"))
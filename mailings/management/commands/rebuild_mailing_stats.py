@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from mailings.services import MailingStatsService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount MailingStats from the raw mailing logs and the rollups of purged logs. "
+        "Run it when no mailing is being sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("mailings", type=int, nargs="*", help="Mailing pks, all mailings by default")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Mailings per query")
+
+    def handle(self, *args, **options):
+        service = MailingStatsService(batch_size=options["batch_size"])
+        rebuilt_count = service.rebuild(options["mailings"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats of {rebuilt_count} mailings"))
@@ -0,0 +1,62 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from mailings.scheduler import DispatchSchedule
+from mailings.tasks import mail_service
+
+
+class Command(BaseCommand):
+    help = (
+        "Resident mailing dispatcher. Sleeps until the next mailing start, end "
+        "or recipient due time and processes mailings. Stops on SIGTERM/SIGINT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--refresh",
+            type=float,
+            default=settings.MAILING_DISPATCHER_REFRESH,
+            help="Max seconds between schedule reloads, picks up mailings changed meanwhile",
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            logging.info(f"dispatcher got signal {signum}, stopping")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        schedule = DispatchSchedule()
+        self.stdout.write(self.style.SUCCESS("Dispatcher started"))
+
+        while not stop_event.is_set():
+            close_old_connections()
+            now = timezone.now()
+            schedule.rebuild(now)
+
+            if schedule.pop_due(now):
+                try:
+                    mail_service.process_mailing_list()
+                except Exception:
+                    logging.exception("dispatch tick failed")
+                    stop_event.wait(options["refresh"])
+                # a mailing leased by another dispatcher stays due, do not spin on it
+                stop_event.wait(settings.MAILING_DISPATCHER_MIN_INTERVAL)
+                continue
+
+            timeout = options["refresh"]
+            next_time = schedule.next_time()
+            if next_time is not None:
+                timeout = min(timeout, (next_time - now).total_seconds())
+            stop_event.wait(timeout)
+
+        self.stdout.write(self.style.SUCCESS("Dispatcher stopped"))
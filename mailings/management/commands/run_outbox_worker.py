@@ -0,0 +1,47 @@
+import logging
+import signal
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections
+
+from mailings.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends emails queued in the outbox. Several workers can run on several hosts. "
+        "Stops on SIGTERM/SIGINT after the current batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Items claimed at once")
+        parser.add_argument("--worker-id", default=None, help="Worker name, host:pid by default")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            logging.info(f"outbox worker got signal {signum}, stopping")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        outbox = OutboxService(worker_id=options["worker_id"], batch_size=options["batch_size"])
+        keep_done = timedelta(days=settings.MAILING_OUTBOX_KEEP_DONE)
+        self.stdout.write(self.style.SUCCESS(f"Outbox worker {outbox.worker_id} started"))
+
+        while not stop_event.is_set():
+            close_old_connections()
+            try:
+                if outbox.process_batch():
+                    continue
+                outbox.purge_done(keep_done)
+            except Exception:
+                logging.exception("outbox batch failed")
+            stop_event.wait(settings.MAILING_OUTBOX_POLL_INTERVAL)
+
+        self.stdout.write(self.style.SUCCESS(f"Outbox worker {outbox.worker_id} stopped"))
@@ -0,0 +1,228 @@
+import re
+from collections import namedtuple
+from email.policy import compat32
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import (
+    RFC5322_EMAIL_LINE_LENGTH_LIMIT,
+    forbid_multi_line_headers,
+    sanitize_address,
+)
+from django.core.mail.utils import DNS_NAME
+
+from config.settings import DEFAULT_FROM_EMAIL
+from .models import Mailing, Client
+
+# Headers which differ from one recipient to another
+RECIPIENT_HEADERS = ("To", "Date", "Message-ID")
+
+# Folds headers the same way as the generator used by mail backends
+HEADER_POLICY = compat32.clone(linesep="\r\n")
+
+# Client fields loaded for dispatch, rows come from values_list(named=True)
+RECIPIENT_FIELDS = ("id", "email", "first_name", "last_name", "note")
+Recipient = namedtuple("Recipient", RECIPIENT_FIELDS)
+
+# Merge fields available in message_title and message_body: {{ first_name }}
+MERGE_FIELDS = ("first_name", "last_name", "full_name", "note", "email")
+MERGE_FIELD_RE = re.compile(r"{{\s*(%s)\s*}}" % "|".join(MERGE_FIELDS))
+
+
+class CompiledTemplate:
+    """
+    Mailing text with merge fields compiled into a str.format pattern,
+    so rendering for a recipient does not parse the text again.
+    """
+
+    def __init__(self, text: str):
+        parts = MERGE_FIELD_RE.split(text)
+        # split() returns literal text at even and field names at odd positions
+        literals = [part.replace("{", "{{").replace("}", "}}") for part in parts[::2]]
+        fields = parts[1::2]
+
+        self.fields = frozenset(fields)
+        self.pattern = literals[0] + "".join(
+            "{%s}%s" % (field, literal) for field, literal in zip(fields, literals[1:])
+        )
+
+    def render(self, context: dict):
+        return self.pattern.format_map(context)
+
+
+@lru_cache(maxsize=settings.MAILING_TEMPLATE_CACHE_SIZE)
+def compile_template(text: str):
+    return CompiledTemplate(text)
+
+
+def get_header_context(context: dict):
+    """Merge values for headers: line breaks of client data would make the header invalid."""
+    return {field: " ".join(value.splitlines()) for field, value in context.items()}
+
+
+def get_merge_context(recipient: Recipient):
+    return {
+        "first_name": recipient.first_name,
+        "last_name": recipient.last_name,
+        "full_name": Client.make_full_name(recipient.first_name, recipient.last_name),
+        "note": recipient.note or "",
+        "email": recipient.email,
+    }
+
+
+class RenderedMessage:
+    """
+    Serialized MIME message with the interface mail backends use
+    (as_bytes, as_string, get_charset).
+    """
+
+    def __init__(self, data: bytes, charset):
+        self.data = data
+        self.charset = charset
+
+    def as_bytes(self, unixfrom=False, linesep="\n"):
+        if linesep == "\r\n":
+            return self.data
+        return self.data.replace(b"\r\n", linesep.encode())
+
+    def as_string(self, unixfrom=False, linesep="\n"):
+        charset = self.charset.get_output_charset() if self.charset else "utf-8"
+        return self.as_bytes(linesep=linesep).decode(charset)
+
+    def get_charset(self):
+        return self.charset
+
+
+@lru_cache(maxsize=settings.MAILING_HEADER_CACHE_SIZE)
+def _fold_encoded_header(name: str, value: str, encoding: str):
+    _, value = forbid_multi_line_headers(name, value, encoding)
+    return HEADER_POLICY.fold_binary(name, value)
+
+
+def fold_header(name: str, value: str, encoding: str):
+    """
+    Serialized header line. Short ascii values are written as is,
+    encoded values are cached: personalized subjects repeat with first names.
+    """
+    if value.isascii() and len(name) + len(value) < 76 and "\n" not in value and "\r" not in value:
+        if name.lower() != "subject":
+            return f"{name}: {value}\r\n".encode("ascii")
+    return _fold_encoded_header(name, value, encoding)
+
+
+class PreparedMessage:
+    """
+    Message of a mailing rendered once: header encoding and MIME
+    serialization are done in __init__, render() only adds the
+    recipient headers.
+    Personalized messages keep the compiled templates and the static
+    headers, only the subject and the body are rendered per recipient.
+    """
+
+    def __init__(self, subject: str, body: str, from_email: str):
+        message = EmailMessage(subject=subject, body=body, from_email=from_email)
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email
+        self.encoding = message.encoding or settings.DEFAULT_CHARSET
+        self.envelope_from = sanitize_address(from_email, self.encoding)
+
+        self.subject_template = compile_template(subject)
+        self.body_template = compile_template(body)
+        self.personalized = bool(self.subject_template.fields or self.body_template.fields)
+
+        mime = message.message()
+        for header in RECIPIENT_HEADERS:
+            del mime[header]
+        self.charset = mime.get_charset()
+        self.data = mime.as_bytes(linesep="\r\n")
+
+        if self.personalized:
+            # headers which do not depend on the subject and the body
+            del mime["Subject"]
+            del mime["Content-Transfer-Encoding"]
+            mime.set_payload("", "utf-8")
+            del mime["Content-Transfer-Encoding"]
+            self.static_headers = mime.as_bytes(linesep="\r\n").rstrip(b"\r\n") + b"\r\n"
+
+    def recipient_headers(self, to: str):
+        return b"".join((
+            fold_header("To", to, self.encoding),
+            f"Date: {formatdate(localtime=settings.EMAIL_USE_LOCALTIME)}\r\n".encode("ascii"),
+            f"Message-ID: {make_msgid(domain=DNS_NAME)}\r\n".encode("ascii"),
+        ))
+
+    def render_text(self, recipient: Recipient):
+        """Subject and body of the recipient, the merge fields filled in."""
+        if not self.personalized:
+            return self.subject, self.body
+        context = get_merge_context(recipient)
+        return self.subject_template.render(get_header_context(context)), self.body_template.render(context)
+
+    def render_personalized(self, subject: str, body: str):
+        has_long_lines = any(
+            len(line.encode(errors="surrogateescape")) > RFC5322_EMAIL_LINE_LENGTH_LIMIT
+            for line in body.splitlines()
+        )
+        if self.encoding != "utf-8" or has_long_lines or "\r" in body:
+            # rare cases which need quoted-printable or another charset
+            message = EmailMessage(subject=subject, body=body, from_email=self.from_email)
+            mime = message.message()
+            for header in RECIPIENT_HEADERS:
+                del mime[header]
+            return mime.as_bytes(linesep="\r\n")
+
+        transfer_encoding = "7bit" if body.isascii() else "8bit"
+        return b"".join((
+            self.static_headers,
+            f"Content-Transfer-Encoding: {transfer_encoding}\r\n".encode("ascii"),
+            fold_header("Subject", subject, self.encoding),
+            b"\r\n",
+            body.replace("\n", "\r\n").encode("utf-8", errors="surrogateescape"),
+        ))
+
+    def render(self, recipient: Recipient, text: tuple = None):
+        """text is the (subject, body) of render_text() when the caller has it already."""
+        if self.personalized:
+            data = self.render_personalized(*(text or self.render_text(recipient)))
+        else:
+            data = self.data
+        return RenderedMessage(self.recipient_headers(recipient.email) + data, self.charset)
+
+
+class PreparedEmailMessage(EmailMessage):
+    """
+    EmailMessage to one recipient built from a PreparedMessage,
+    can be sent with any django mail backend. subject and body hold the
+    personalized text, as read by the locmem outbox or custom backends.
+    """
+
+    def __init__(self, prepared: PreparedMessage, recipient: Recipient, connection=None):
+        subject, body = prepared.render_text(recipient)
+        super().__init__(
+            subject=subject,
+            body=body,
+            from_email=prepared.from_email,
+            to=[recipient.email],
+            connection=connection,
+        )
+        self.prepared = prepared
+        self.recipient = recipient
+
+    def message(self):
+        return self.prepared.render(self.recipient, (self.subject, self.body))
+
+
+@lru_cache(maxsize=settings.MAILING_MESSAGE_CACHE_SIZE)
+def _get_prepared_message(subject: str, body: str, from_email: str):
+    return PreparedMessage(subject, body, from_email)
+
+
+def get_prepared_message(mailing: Mailing):
+    """
+    Cached PreparedMessage of a mailing. The cache is keyed by the message
+    content, so an edited mailing gets a new message and the old one is evicted.
+    """
+    return _get_prepared_message(mailing.message_title, mailing.message_body, DEFAULT_FROM_EMAIL)
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0015_audience_creator_client_creator"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="workers",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="Если не задано, используется MAILING_DISPATCH_WORKERS",
+                null=True,
+                verbose_name="потоков отправки",
+            ),
+        ),
+    ]
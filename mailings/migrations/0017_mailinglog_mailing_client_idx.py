@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0016_mailing_workers"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailinglog",
+            index=models.Index(
+                fields=["mailing", "client", "time"],
+                name="mailinglog_mailing_client_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0017_mailinglog_mailing_client_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["status", "start_time", "end_time"],
+                name="mailing_status_time_idx",
+            ),
+        ),
+    ]
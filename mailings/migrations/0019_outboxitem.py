@@ -0,0 +1,100 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0018_mailing_status_time_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает отправки"),
+                            ("processing", "Отправляется"),
+                            ("done", "Отправлено"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="статус",
+                    ),
+                ),
+                (
+                    "worker",
+                    models.CharField(
+                        blank=True, max_length=100, null=True, verbose_name="обработчик"
+                    ),
+                ),
+                (
+                    "lease_until",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="занято до"
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="попыток"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="добавлено"),
+                ),
+                (
+                    "done_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="отправлено"
+                    ),
+                ),
+                (
+                    "client",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.client",
+                        verbose_name="получатель",
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.mailing",
+                        verbose_name="рассылка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "отправка в очереди",
+                "verbose_name_plural": "очередь отправки",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "lease_until"], name="outbox_status_lease_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="outboxitem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ("pending", "processing"))),
+                fields=("mailing", "client"),
+                name="outbox_active_mailing_client_uniq",
+            ),
+        ),
+    ]
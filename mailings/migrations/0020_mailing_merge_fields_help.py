@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0019_outboxitem"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailing",
+            name="message_body",
+            field=models.TextField(
+                help_text="Поля получателя: {{ first_name }}, {{ last_name }}, {{ full_name }}, {{ note }}, {{ email }}",
+                verbose_name="текст рассылки",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="mailing",
+            name="message_title",
+            field=models.CharField(
+                help_text="Поля получателя: {{ first_name }}, {{ last_name }}, {{ full_name }}, {{ note }}, {{ email }}",
+                max_length=150,
+                verbose_name="заголовок",
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0020_mailing_merge_fields_help"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeliveryRetry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="попыток"),
+                ),
+                (
+                    "next_retry_at",
+                    models.DateTimeField(verbose_name="следующая попытка"),
+                ),
+                (
+                    "error_class",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="тип ошибки"
+                    ),
+                ),
+                (
+                    "client",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.client",
+                        verbose_name="получатель",
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.mailing",
+                        verbose_name="рассылка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "повторная отправка",
+                "verbose_name_plural": "повторные отправки",
+                "indexes": [
+                    models.Index(
+                        fields=["mailing", "next_retry_at"],
+                        name="retry_mailing_next_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="deliveryretry",
+            constraint=models.UniqueConstraint(
+                fields=("mailing", "client"), name="retry_mailing_client_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0021_deliveryretry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingLease",
+            fields=[
+                (
+                    "mailing",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="mailings.mailing",
+                        verbose_name="рассылка",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.CharField(
+                        blank=True, max_length=150, verbose_name="владелец"
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(verbose_name="действует до")),
+                (
+                    "checkpoint",
+                    models.BigIntegerField(
+                        blank=True,
+                        null=True,
+                        verbose_name="последний обработанный клиент",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "блокировка рассылки",
+                "verbose_name_plural": "блокировки рассылок",
+            },
+        ),
+    ]
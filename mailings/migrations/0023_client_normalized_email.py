@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:59
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+BATCH_SIZE = 1000
+
+
+def fill_normalized_email(apps, schema_editor):
+    """Updates the clients by pk ranges of BATCH_SIZE rows, each range commits on its own."""
+    Client = apps.get_model("mailings", "Client")
+    last_pk = 0
+    while True:
+        pks = list(
+            Client.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            return
+        Client.objects.filter(pk__gt=last_pk, pk__lte=pks[-1]).update(normalized_email=Lower(Trim("email")))
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    # the backfill commits by batches and does not lock the whole table until the end
+    atomic = False
+
+    dependencies = [
+        ("mailings", "0022_mailinglease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="normalized_email",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=254,
+                verbose_name="email в нижнем регистре",
+            ),
+        ),
+        migrations.RunPython(fill_normalized_email, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:01
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, Min
+
+BATCH_SIZE = 1000
+
+
+def merge_duplicate_clients(apps, schema_editor):
+    """
+    Merges clients of one creator with the same normalized email into the one with the lowest id,
+    the same way as ClientMergeService at the time of this migration. Audience memberships and
+    mailing logs move to the kept client. Every BATCH_SIZE emails commit on their own.
+    """
+    Client = apps.get_model("mailings", "Client")
+    MailingLog = apps.get_model("mailings", "MailingLog")
+    Membership = apps.get_model("mailings", "Audience").recipients.through
+
+    groups = list(
+        Client.objects.exclude(normalized_email="")
+        .values("creator", "normalized_email")
+        .annotate(keep_id=Min("pk"), clients_count=Count("pk"))
+        .filter(clients_count__gt=1)
+        .order_by()
+        .values_list("creator", "normalized_email", "keep_id")
+    )
+    for start in range(0, len(groups), BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for creator_id, normalized_email, keep_id in groups[start:start + BATCH_SIZE]:
+                duplicate_ids = list(
+                    Client.objects.filter(creator_id=creator_id, normalized_email=normalized_email)
+                    .exclude(pk=keep_id)
+                    .values_list("pk", flat=True)
+                )
+                audience_ids = (
+                    Membership.objects.filter(client_id__in=duplicate_ids)
+                    .values_list("audience_id", flat=True)
+                    .distinct()
+                )
+                Membership.objects.bulk_create(
+                    [Membership(audience_id=audience_id, client_id=keep_id) for audience_id in audience_ids],
+                    ignore_conflicts=True,
+                )
+                MailingLog.objects.filter(client_id__in=duplicate_ids).update(client_id=keep_id)
+                Client.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # the merge commits in batches, like the dedupe_clients command
+    atomic = False
+
+    dependencies = [
+        ("mailings", "0023_client_normalized_email"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_clients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="client",
+            constraint=models.UniqueConstraint(
+                fields=("creator", "normalized_email"), name="client_creator_email_uniq"
+            ),
+        ),
+    ]
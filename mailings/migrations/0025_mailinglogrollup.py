@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0024_client_creator_email_uniq"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingLogRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="дата")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("success", "Доставлено"),
+                            ("fail", "Не доставлено"),
+                            ("error", "Ошибка"),
+                        ],
+                        max_length=20,
+                        verbose_name="статус",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(default=0, verbose_name="количество"),
+                ),
+            ],
+            options={
+                "verbose_name": "итог логов за день",
+                "verbose_name_plural": "итоги логов за день",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="mailinglog",
+            index=models.Index(fields=["time"], name="mailinglog_time_idx"),
+        ),
+        migrations.AddField(
+            model_name="mailinglogrollup",
+            name="mailing",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="mailings.mailing",
+                verbose_name="рассылка",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="mailinglogrollup",
+            constraint=models.UniqueConstraint(
+                fields=("mailing", "date", "status"),
+                name="rollup_mailing_date_status_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0025_mailinglogrollup"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="mailinglog",
+            name="mailinglog_time_idx",
+        ),
+        migrations.AddIndex(
+            model_name="mailinglog",
+            index=models.Index(fields=["time", "id"], name="mailinglog_time_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="mailinglog",
+            index=models.Index(
+                fields=["mailing", "time", "id"], name="mailinglog_mailing_time_idx"
+            ),
+        ),
+    ]
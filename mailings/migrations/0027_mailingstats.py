@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:06
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+STATUS_FIELDS = {"success": "success_count", "fail": "fail_count", "error": "error_count"}
+
+
+def build_mailing_stats(apps, schema_editor):
+    """Counts the raw logs and the rollups of purged logs of every mailing, BATCH_SIZE mailings per query."""
+    Mailing = apps.get_model("mailings", "Mailing")
+    MailingLog = apps.get_model("mailings", "MailingLog")
+    MailingLogRollup = apps.get_model("mailings", "MailingLogRollup")
+    MailingStats = apps.get_model("mailings", "MailingStats")
+
+    mailing_ids = list(Mailing.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(mailing_ids), BATCH_SIZE):
+        batch_ids = mailing_ids[start:start + BATCH_SIZE]
+        raw_counts = {
+            row["mailing"]: row
+            for row in MailingLog.objects.filter(mailing_id__in=batch_ids)
+            .values("mailing")
+            .annotate(
+                **{field: Count("pk", filter=Q(status=status)) for status, field in STATUS_FIELDS.items()},
+                recipients_count=Count("client", distinct=True, filter=Q(status="success")),
+                last_send_time=Max("time"),
+            )
+            .order_by()
+        }
+        rolled_counts = {
+            row["mailing"]: row
+            for row in MailingLogRollup.objects.filter(mailing_id__in=batch_ids)
+            .values("mailing")
+            .annotate(**{field: Sum("count", filter=Q(status=status)) for status, field in STATUS_FIELDS.items()})
+            .order_by()
+        }
+
+        stats = []
+        for mailing_id in batch_ids:
+            raw = raw_counts.get(mailing_id, {})
+            rolled = rolled_counts.get(mailing_id, {})
+            stats.append(MailingStats(
+                mailing_id=mailing_id,
+                **{field: (raw.get(field) or 0) + (rolled.get(field) or 0) for field in STATUS_FIELDS.values()},
+                recipients_count=raw.get("recipients_count") or 0,
+                last_send_time=raw.get("last_send_time"),
+            ))
+        MailingStats.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0026_mailinglog_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingStats",
+            fields=[
+                (
+                    "mailing",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="mailings.mailing",
+                        verbose_name="рассылка",
+                    ),
+                ),
+                (
+                    "success_count",
+                    models.PositiveIntegerField(default=0, verbose_name="доставлено"),
+                ),
+                (
+                    "fail_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="не доставлено"
+                    ),
+                ),
+                (
+                    "error_count",
+                    models.PositiveIntegerField(default=0, verbose_name="ошибок"),
+                ),
+                (
+                    "recipients_count",
+                    models.PositiveIntegerField(default=0, verbose_name="получателей"),
+                ),
+                (
+                    "last_send_time",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="последняя отправка"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "статистика рассылки",
+                "verbose_name_plural": "статистика рассылок",
+            },
+        ),
+        migrations.RunPython(build_mailing_stats, migrations.RunPython.noop),
+    ]
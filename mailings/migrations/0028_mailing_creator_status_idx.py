@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0027_mailingstats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["creator", "status"], name="mailing_creator_status_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0028_mailing_creator_status_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailinglog",
+            name="time",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False, verbose_name="время"
+            ),
+        ),
+    ]
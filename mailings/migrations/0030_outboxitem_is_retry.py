@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0029_mailinglog_time_send_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxitem",
+            name="is_retry",
+            field=models.BooleanField(default=False, verbose_name="повтор"),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_reached_recipients(apps, schema_editor):
+    """Keeps the first success log of every (mailing, client) and recounts the reached recipients of the stats."""
+    Mailing = apps.get_model("mailings", "Mailing")
+    MailingLog = apps.get_model("mailings", "MailingLog")
+    MailingStats = apps.get_model("mailings", "MailingStats")
+    ReachedRecipient = apps.get_model("mailings", "ReachedRecipient")
+
+    for mailing_id in Mailing.objects.order_by("pk").values_list("pk", flat=True).iterator():
+        first_sends = (
+            MailingLog.objects.filter(mailing_id=mailing_id, status="success")
+            .values("client")
+            .annotate(time=Min("time"))
+            .order_by("client")
+            .values_list("client", "time")
+        )
+        reached_count = 0
+        batch = []
+        for client_id, time in first_sends.iterator():
+            batch.append(ReachedRecipient(mailing_id=mailing_id, client_id=client_id, time=time))
+            if len(batch) >= BATCH_SIZE:
+                ReachedRecipient.objects.bulk_create(batch)
+                reached_count += len(batch)
+                batch = []
+        ReachedRecipient.objects.bulk_create(batch)
+        reached_count += len(batch)
+        MailingStats.objects.filter(mailing_id=mailing_id).update(recipients_count=reached_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailings", "0030_outboxitem_is_retry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReachedRecipient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("time", models.DateTimeField(verbose_name="первая доставка")),
+                (
+                    "client",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.client",
+                        verbose_name="получатель",
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="mailings.mailing",
+                        verbose_name="рассылка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "получатель, которому доставлена рассылка",
+                "verbose_name_plural": "получатели, которым доставлена рассылка",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="reachedrecipient",
+            constraint=models.UniqueConstraint(
+                fields=("mailing", "client"), name="reached_mailing_client_uniq"
+            ),
+        ),
+        migrations.RunPython(fill_reached_recipients, migrations.RunPython.noop),
+    ]
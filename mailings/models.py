@@ -1,21 +1,91 @@
 from datetime import timedelta
 
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Lower, Trim
+from django.utils import timezone
+
+MERGE_FIELDS_HELP = (
+    'Поля получателя: {{ first_name }}, {{ last_name }}, {{ full_name }}, {{ note }}, {{ email }}'
+)
+
+
+class ClientQuerySet(models.QuerySet):
+    """Keeps normalized_email in sync in bulk operations, which skip Client.save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.normalized_email = Client.normalize_email(obj.email)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if 'email' in fields:
+            for obj in objs:
+                obj.normalized_email = Client.normalize_email(obj.email)
+            if 'normalized_email' not in fields:
+                fields.append('normalized_email')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if 'email' in kwargs:
+            email = kwargs['email']
+            kwargs['normalized_email'] = (
+                Client.normalize_email(email) if isinstance(email, str) else Lower(Trim(email))
+            )
+        return super().update(**kwargs)
 
 
 class Client(models.Model):
     first_name = models.CharField(max_length=30, verbose_name='имя')
     last_name = models.CharField(max_length=30, verbose_name='фамилия')
     email = models.EmailField(verbose_name='email')
+    normalized_email = models.CharField(
+        max_length=254, verbose_name='email в нижнем регистре', db_index=True, editable=False, default=''
+    )
     note = models.CharField(max_length=300, verbose_name='комментарий', null=True, blank=True)
     creator = models.ForeignKey('users.User', verbose_name='добавил', on_delete=models.CASCADE)
 
+    objects = ClientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'клиент'
         verbose_name_plural = 'клиенты'
+        constraints = [
+            # the unique index also serves lookups of a creator's client by email
+            models.UniqueConstraint(fields=['creator', 'normalized_email'], name='client_creator_email_uniq'),
+        ]
+
+    @staticmethod
+    def make_full_name(first_name, last_name):
+        return f"{first_name} {last_name[:1]}."
+
+    @staticmethod
+    def normalize_email(email):
+        return (email or '').strip().lower()
+
+    def clean(self):
+        # normalized_email is not editable, so the unique constraint is not validated by model forms
+        self.normalized_email = self.normalize_email(self.email)
+        if self.creator_id is None:
+            return
+        duplicates = Client.objects.filter(
+            creator_id=self.creator_id, normalized_email=self.normalized_email
+        ).exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError({'email': 'Получатель с таким email уже добавлен'})
+
+    def save(self, *args, **kwargs):
+        self.normalized_email = self.normalize_email(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_email'}
+        super().save(*args, **kwargs)
 
     def full_name(self):
-        return f"{self.first_name} {self.last_name[:1]}."
+        return self.make_full_name(self.first_name, self.last_name)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name[:1]}. ({self.email})"
@@ -65,14 +135,25 @@ class Mailing(models.Model):
     start_time = models.DateTimeField(verbose_name='время начала')
     end_time = models.DateTimeField(verbose_name='время окончания')
 
-    message_title = models.CharField(max_length=150, verbose_name='заголовок')
-    message_body = models.TextField(verbose_name='текст рассылки')
+    message_title = models.CharField(max_length=150, verbose_name='заголовок', help_text=MERGE_FIELDS_HELP)
+    message_body = models.TextField(verbose_name='текст рассылки', help_text=MERGE_FIELDS_HELP)
 
     creator = models.ForeignKey('users.User', on_delete=models.CASCADE, verbose_name='создал')
 
+    workers = models.PositiveSmallIntegerField(
+        verbose_name='потоков отправки',
+        help_text='Если не задано, используется MAILING_DISPATCH_WORKERS',
+        null=True,
+        blank=True,
+    )
+
     class Meta:
         verbose_name = 'рассылка'
         verbose_name_plural = 'рассылки'
+        indexes = [
+            models.Index(fields=['status', 'start_time', 'end_time'], name='mailing_status_time_idx'),
+            models.Index(fields=['creator', 'status'], name='mailing_creator_status_idx'),
+        ]
         permissions = [
             (
                 'stop_mailing',
@@ -99,7 +180,8 @@ class MailingLog(models.Model):
         (STATUS_ERROR, 'Ошибка'),
     )
 
-    time = models.DateTimeField(auto_now_add=True, verbose_name='время')
+    # set when the row is built right after the send, not when the buffered row is saved
+    time = models.DateTimeField(default=timezone.now, editable=False, verbose_name='время')
     client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name='получатель', related_name='logs')
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='рассылка')
     status = models.CharField(max_length=20, choices=STATUSES, verbose_name='статус')
@@ -108,6 +190,151 @@ class MailingLog(models.Model):
     class Meta:
         verbose_name = 'лог'
         verbose_name_plural = 'логи'
+        indexes = [
+            models.Index(fields=['mailing', 'client', 'time'], name='mailinglog_mailing_client_idx'),
+            # keyset pagination of the logs list on (time, id), also used by the purge
+            models.Index(fields=['time', 'id'], name='mailinglog_time_id_idx'),
+            models.Index(fields=['mailing', 'time', 'id'], name='mailinglog_mailing_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.client}, {self.status}, {self.time}"
+
+
+class MailingStats(models.Model):
+    """
+    Delivery counters of a mailing, updated in the transaction which saves its logs.
+    Can be rebuilt from the logs, the rollups and the reached recipients with `manage.py rebuild_mailing_stats`.
+    """
+
+    mailing = models.OneToOneField(
+        Mailing, on_delete=models.CASCADE, primary_key=True, related_name='stats', verbose_name='рассылка'
+    )
+    success_count = models.PositiveIntegerField(verbose_name='доставлено', default=0)
+    fail_count = models.PositiveIntegerField(verbose_name='не доставлено', default=0)
+    error_count = models.PositiveIntegerField(verbose_name='ошибок', default=0)
+    recipients_count = models.PositiveIntegerField(verbose_name='получателей', default=0)
+    last_send_time = models.DateTimeField(verbose_name='последняя отправка', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'статистика рассылки'
+        verbose_name_plural = 'статистика рассылок'
+
+    @property
+    def sent_count(self):
+        return self.success_count + self.fail_count + self.error_count
+
+    def __str__(self):
+        return f"{self.mailing}: {self.success_count}/{self.sent_count}"
+
+
+class ReachedRecipient(models.Model):
+    """First successful delivery of a mailing to a client, kept when the logs are purged."""
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='рассылка')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name='получатель')
+    time = models.DateTimeField(verbose_name='первая доставка')
+
+    class Meta:
+        verbose_name = 'получатель, которому доставлена рассылка'
+        verbose_name_plural = 'получатели, которым доставлена рассылка'
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'client'], name='reached_mailing_client_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing}, {self.client}, {self.time}"
+
+
+class MailingLogRollup(models.Model):
+    """Number of purged MailingLog rows of a mailing per day and status."""
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='рассылка')
+    date = models.DateField(verbose_name='дата')
+    status = models.CharField(max_length=20, choices=MailingLog.STATUSES, verbose_name='статус')
+    count = models.PositiveIntegerField(verbose_name='количество', default=0)
+
+    class Meta:
+        verbose_name = 'итог логов за день'
+        verbose_name_plural = 'итоги логов за день'
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'date', 'status'], name='rollup_mailing_date_status_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing}, {self.date}, {self.status}: {self.count}"
+
+
+class OutboxItem(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+
+    STATUSES = (
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_PROCESSING, 'Отправляется'),
+        (STATUS_DONE, 'Отправлено'),
+    )
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_PROCESSING)
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='рассылка')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name='получатель')
+    status = models.CharField(max_length=20, choices=STATUSES, verbose_name='статус', default=STATUS_PENDING)
+    worker = models.CharField(max_length=100, verbose_name='обработчик', null=True, blank=True)
+    lease_until = models.DateTimeField(verbose_name='занято до', null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(verbose_name='попыток', default=0)
+    is_retry = models.BooleanField(verbose_name='повтор', default=False)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='добавлено')
+    done_at = models.DateTimeField(verbose_name='отправлено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'отправка в очереди'
+        verbose_name_plural = 'очередь отправки'
+        indexes = [
+            models.Index(fields=['status', 'lease_until'], name='outbox_status_lease_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mailing', 'client'],
+                condition=models.Q(status__in=('pending', 'processing')),
+                name='outbox_active_mailing_client_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing}, {self.client}, {self.status}"
+
+
+class DeliveryRetry(models.Model):
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='рассылка')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, verbose_name='получатель')
+    attempts = models.PositiveSmallIntegerField(verbose_name='попыток', default=0)
+    next_retry_at = models.DateTimeField(verbose_name='следующая попытка')
+    error_class = models.CharField(max_length=100, verbose_name='тип ошибки', blank=True)
+
+    class Meta:
+        verbose_name = 'повторная отправка'
+        verbose_name_plural = 'повторные отправки'
+        indexes = [
+            models.Index(fields=['mailing', 'next_retry_at'], name='retry_mailing_next_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'client'], name='retry_mailing_client_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing}, {self.client}, {self.next_retry_at}"
+
+
+class MailingLease(models.Model):
+    mailing = models.OneToOneField(Mailing, on_delete=models.CASCADE, primary_key=True, verbose_name='рассылка')
+    owner = models.CharField(max_length=150, verbose_name='владелец', blank=True)
+    expires_at = models.DateTimeField(verbose_name='действует до')
+    checkpoint = models.BigIntegerField(verbose_name='последний обработанный клиент', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'блокировка рассылки'
+        verbose_name_plural = 'блокировки рассылок'
+
+    def __str__(self):
+        return f"{self.mailing}, {self.owner}, {self.expires_at}"
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import deque, Counter
+from smtplib import SMTPRecipientsRefused, SMTPResponseException
+
+from django.conf import settings
+
+# SMTP replies which mean "slow down": service not available, mailbox busy, local error
+THROTTLING_CODES = (421, 450, 451, 452)
+
+
+def get_domain(email: str):
+    return email.rsplit("@", 1)[-1].strip().lower()
+
+
+def get_smtp_code(ex: Exception):
+    """SMTP reply code of a sending error, the code of the refused recipient for RCPT refusals."""
+    if isinstance(ex, SMTPResponseException):
+        return ex.smtp_code
+    if isinstance(ex, SMTPRecipientsRefused) and ex.recipients:
+        return max(code for code, _ in ex.recipients.values())
+    return None
+
+
+def is_throttling_error(ex: Exception):
+    if isinstance(ex, SMTPResponseException):
+        return ex.smtp_code in THROTTLING_CODES
+    if isinstance(ex, SMTPRecipientsRefused):
+        return any(code in THROTTLING_CODES for code, _ in ex.recipients.values())
+    return False
+
+
+class TokenBucket:
+    """
+    Allows `rate` sends per second with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float):
+        """Seconds until a token is available, 0 if it is available now."""
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Token buckets per SMTP relay and per recipient domain.
+    Limits come from MAILING_RATE_LIMITS, a missing limit means no limit.
+    The limiter is shared by all sending threads of the process, but the buckets
+    live in process memory: every dispatcher or outbox worker process has its own,
+    so the limits are per process and the relay sees them multiplied by the number
+    of sending processes on all hosts.
+    """
+
+    def __init__(self, limits: dict = None):
+        limits = settings.MAILING_RATE_LIMITS if limits is None else limits
+        self.relay_limit = limits.get("relay")
+        self.default_domain_limit = limits.get("default_domain")
+        self.domain_limits = limits.get("domains", {})
+        self.throttle_penalty = limits.get("throttle_penalty", 60)
+
+        self.buckets = {}
+        self.paused_until = {}
+        self.lock = threading.Lock()
+        self.sent = Counter()
+        self.throttled = Counter()
+        self.penalties = Counter()
+
+    @staticmethod
+    def relay_key():
+        return f"relay:{settings.EMAIL_HOST}:{settings.EMAIL_PORT}"
+
+    def get_bucket(self, key: str, limit):
+        if limit is None:
+            return None
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(*limit)
+        return self.buckets[key]
+
+    def domain_bucket(self, domain: str):
+        limit = self.domain_limits.get(domain, self.default_domain_limit)
+        return self.get_bucket(f"domain:{domain}", limit)
+
+    def relay_bucket(self):
+        return self.get_bucket(self.relay_key(), self.relay_limit)
+
+    def wait_time(self, domain: str, now: float):
+        """Must be called under the lock."""
+        buckets = (self.relay_bucket(), self.domain_bucket(domain))
+        wait = max((bucket.wait_time(now) for bucket in buckets if bucket), default=0.0)
+        return max(wait, self.paused_until.get(domain, now) - now)
+
+    def take(self, domain: str):
+        """Must be called under the lock, after wait_time returned 0."""
+        for bucket in (self.relay_bucket(), self.domain_bucket(domain)):
+            if bucket:
+                bucket.take()
+        self.sent[domain] += 1
+
+    def report_error(self, email: str, ex: Exception):
+        """Pauses the recipient domain when the server asks to slow down."""
+        if not is_throttling_error(ex):
+            return
+        domain = get_domain(email)
+        with self.lock:
+            self.paused_until[domain] = time.monotonic() + self.throttle_penalty
+            self.penalties[domain] += 1
+
+    def snapshot(self):
+        """Counters for metrics: sends, throttled waits and penalties per domain."""
+        with self.lock:
+            return {
+                "sent": dict(self.sent),
+                "throttled": dict(self.throttled),
+                "penalties": dict(self.penalties),
+            }
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def reset_rate_limiter():
+    """Drops the buckets and counters, the limits are read from settings again."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
+
+
+class ThrottledRecipients:
+    """
+    Thread-safe iterator over recipients which respects the rate limits.
+    Recipients are grouped by domain, while one domain is throttled
+    the recipients of other domains go first.
+    """
+
+    def __init__(self, recipients, rate_limiter: RateLimiter = None):
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.queues = {}
+        for recipient in recipients:
+            self.queues.setdefault(get_domain(recipient.email), deque()).append(recipient)
+        self.domains = deque(self.queues)
+
+    def poll(self):
+        """
+        Returns (recipient, 0) when a recipient can be sent now,
+        (None, seconds to wait) when every domain is throttled.
+        Raises StopIteration when all recipients are taken.
+        """
+        limiter = self.rate_limiter
+        with limiter.lock:
+            if not self.domains:
+                raise StopIteration
+
+            now = time.monotonic()
+            min_wait = None
+            for _ in range(len(self.domains)):
+                domain = self.domains[0]
+                self.domains.rotate(-1)
+
+                wait = limiter.wait_time(domain, now)
+                if wait:
+                    limiter.throttled[domain] += 1
+                    min_wait = wait if min_wait is None else min(min_wait, wait)
+                    continue
+
+                limiter.take(domain)
+                queue = self.queues[domain]
+                recipient = queue.popleft()
+                if not queue:
+                    del self.queues[domain]
+                    self.domains.remove(domain)
+                return recipient, 0.0
+
+            return None, min_wait
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            recipient, wait = self.poll()
+            if recipient is not None:
+                return recipient
+            time.sleep(wait)
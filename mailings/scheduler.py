@@ -0,0 +1,76 @@
+import heapq
+from datetime import datetime
+
+from django.db.models import Exists, Min, OuterRef, Subquery
+
+from .models import Mailing, MailingLog, DeliveryRetry, OutboxItem
+from .services import MailService
+
+EVENT_START = "start"
+EVENT_END = "end"
+EVENT_DUE = "due"
+
+
+class DispatchSchedule:
+    """
+    Heap of upcoming dispatch moments: mailing start and end times
+    and the moments when recipients of started mailings become due.
+    """
+
+    def __init__(self):
+        self.heap = []
+
+    @staticmethod
+    def get_due_time(mailing: Mailing, now: datetime):
+        """
+        Returns the moment when the next recipient of a started mailing
+        becomes due or has a retry, now if somebody is due already.
+        """
+        if MailService.get_due_recipients_queryset(mailing, now).exists():
+            return now
+
+        # only current audience members count: a client who left would be "due" forever.
+        # Every member takes one lookup of its last log on the (mailing, client, time) index.
+        last_logs = MailingLog.objects.filter(mailing=mailing, client=OuterRef("pk")).order_by("-time")
+        members = MailService.exclude_duplicates(mailing, mailing.audience.recipients.all())
+        last_send = members.annotate(
+            last_time=Subquery(last_logs.values("time")[:1])
+        ).aggregate(next_time=Min("last_time"))["next_time"]
+        # retries waiting in the outbox are not due for the tick
+        queued = OutboxItem.objects.filter(
+            mailing=mailing, client=OuterRef("client"), status__in=OutboxItem.ACTIVE_STATUSES
+        )
+        next_retry = DeliveryRetry.objects.filter(mailing=mailing).exclude(Exists(queued)).aggregate(
+            next_time=Min("next_retry_at")
+        )["next_time"]
+
+        due_times = [time for time in (last_send and last_send + mailing.period.duration, next_retry) if time]
+        return max(min(due_times), now) if due_times else None
+
+    def rebuild(self, now: datetime):
+        heap = []
+
+        waiting = Mailing.objects.filter(status=Mailing.STATUS_CREATED, end_time__gt=now)
+        for pk, start_time, end_time in waiting.values_list("pk", "start_time", "end_time"):
+            heap.append((start_time, pk, EVENT_START))
+            heap.append((end_time, pk, EVENT_END))
+
+        started = Mailing.objects.filter(status=Mailing.STATUS_STARTED).select_related("period", "audience")
+        for mailing in started:
+            heap.append((mailing.end_time, mailing.pk, EVENT_END))
+            due_time = self.get_due_time(mailing, now)
+            if due_time is not None and due_time < mailing.end_time:
+                heap.append((due_time, mailing.pk, EVENT_DUE))
+
+        heapq.heapify(heap)
+        self.heap = heap
+
+    def next_time(self):
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: datetime):
+        """Removes and returns all events which are due at the moment."""
+        events = []
+        while self.heap and self.heap[0][0] <= now:
+            events.append(heapq.heappop(self.heap))
+        return events
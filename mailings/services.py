@@ -1,11 +1,41 @@
+import csv
+import io
+import json
 import logging
-from smtplib import SMTPException
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from smtplib import SMTPException, SMTPRecipientsRefused
 
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce, Greatest, Lower, Trim, TruncDate
 from django.utils import timezone
 
-from config.settings import DEFAULT_FROM_EMAIL
-from .models import Mailing, Client, MailingLog
+from .messages import RECIPIENT_FIELDS, PreparedEmailMessage, Recipient, get_prepared_message
+from .models import (
+    Audience,
+    Client,
+    Mailing,
+    MailingLog,
+    MailingLogRollup,
+    MailingStats,
+    OutboxItem,
+    DeliveryRetry,
+    MailingLease,
+    Periods,
+    ReachedRecipient,
+)
+from .rate_limits import ThrottledRecipients, get_rate_limiter, get_smtp_code
 
 logging.basicConfig(level=logging.INFO, filename="log.log")
 
@@ -23,67 +53,523 @@ class MailingStatusesService:
         mailing.save()
 
     @staticmethod
-    def get_mailings_list():
-        return Mailing.objects.all()
+    def get_mailings_to_start(now):
+        return Mailing.objects.filter(
+            status=Mailing.STATUS_CREATED,
+            start_time__lte=now,
+            end_time__gt=now,
+        )
+
+    @staticmethod
+    def get_mailings_to_finish(now):
+        return Mailing.objects.filter(
+            status__in=(Mailing.STATUS_CREATED, Mailing.STATUS_STARTED),
+            end_time__lte=now,
+        )
 
     def update_statuses(self):
-        mailings_list = self.get_mailings_list()
+        """
+        Moves mailings between statuses with two bulk UPDATEs,
+        touching only rows whose status changes.
+        Returns the numbers of started and finished mailings.
+        """
+        now = timezone.now()
+
+        started_count = self.get_mailings_to_start(now).update(status=Mailing.STATUS_STARTED)
+        finished_count = self.get_mailings_to_finish(now).update(status=Mailing.STATUS_FINISHED)
+        if finished_count:
+            DeliveryRetry.objects.filter(mailing__status=Mailing.STATUS_FINISHED).delete()
+        if started_count or finished_count:
+            # bulk updates send no post_save
+            DashboardService.bump_version()
+
+        logging.info(f"mailings started: {started_count}, finished: {finished_count}")
+        return started_count, finished_count
+
+
+class MailConnection:
+    """
+    Keeps one mail backend connection open for a series of emails.
+    The connection is reopened after MAILING_MESSAGES_PER_CONNECTION
+    messages or after a sending error.
+    """
+
+    def __init__(self, max_messages: int = None):
+        self.max_messages = max_messages or settings.MAILING_MESSAGES_PER_CONNECTION
+        self.connection = None
+        self.sent_count = 0
+
+    def get(self):
+        if self.connection is not None and self.sent_count >= self.max_messages:
+            self.close()
+
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+            self.connection.open()
+            self.sent_count = 0
+
+        return self.connection
+
+    def message_sent(self):
+        self.sent_count += 1
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as ex:
+                logging.warning(f"closing mail connection failed: {ex}")
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RetryService:
+    """
+    Schedules failed deliveries for a retry with exponential backoff.
+    The delay depends on the error class, see MAILING_RETRY_POLICY.
+    A 5xx refusal of the recipient is final, a 4xx one (greylisting, throttling) is retried.
+    Due retries are read through the (mailing, next_retry_at) index,
+    so a tick never scans the failed history.
+    """
+
+    @staticmethod
+    def get_policy(error_class, smtp_code: int = None):
+        """Returns (delay, factor, max attempts) or None when the error is not retried."""
+        policy = settings.MAILING_RETRY_POLICY
+        if error_class is None:
+            return policy["failed"]
+        if issubclass(error_class, SMTPRecipientsRefused) and (smtp_code is None or smtp_code >= 500):
+            return None
+        for klass in error_class.__mro__:
+            if klass.__name__ in policy:
+                return policy[klass.__name__]
+        return policy["default"]
+
+    @classmethod
+    def schedule(cls, logs: list):
+        """Updates the retries of the logged recipients. Called with every saved batch of logs."""
+        now = timezone.now()
+        delivered = {}
+        failed = {}
+        for log in logs:
+            group = delivered if log.status == MailingLog.STATUS_SUCCESS else failed
+            group.setdefault(log.mailing_id, []).append(log)
+
+        for mailing_id, mailing_logs in delivered.items():
+            DeliveryRetry.objects.filter(
+                mailing_id=mailing_id,
+                client_id__in=[log.client_id for log in mailing_logs],
+            ).delete()
+
+        for mailing_id, mailing_logs in failed.items():
+            client_ids = [log.client_id for log in mailing_logs]
+            attempts = dict(
+                DeliveryRetry.objects.filter(mailing_id=mailing_id, client_id__in=client_ids)
+                .values_list("client_id", "attempts")
+            )
 
+            retries = {}
+            exhausted = []
+            for log in mailing_logs:
+                error_class = getattr(log, "error_class", None)
+                policy = cls.get_policy(error_class, getattr(log, "smtp_code", None))
+                attempt = attempts.get(log.client_id, 0) + 1
+                if policy is None or attempt > policy[2]:
+                    exhausted.append(log.client_id)
+                    continue
+                delay, factor, _ = policy
+                retries[log.client_id] = DeliveryRetry(
+                    mailing_id=mailing_id,
+                    client_id=log.client_id,
+                    attempts=attempt,
+                    next_retry_at=now + timedelta(seconds=delay * factor ** (attempt - 1)),
+                    error_class=error_class.__name__ if error_class else "",
+                )
+
+            if exhausted:
+                DeliveryRetry.objects.filter(mailing_id=mailing_id, client_id__in=exhausted).delete()
+            if retries:
+                DeliveryRetry.objects.bulk_create(
+                    retries.values(),
+                    update_conflicts=True,
+                    unique_fields=["mailing", "client"],
+                    update_fields=["attempts", "next_retry_at", "error_class"],
+                )
+
+    @staticmethod
+    def get_due_retries(mailing: Mailing, limit: int, now=None):
+        """Client ids of the recipients whose retry is due, the earliest first."""
+        return list(
+            DeliveryRetry.objects.filter(mailing=mailing, next_retry_at__lte=now or timezone.now())
+            .order_by("next_retry_at")
+            .values_list("client_id", flat=True)[:limit]
+        )
+
+    @staticmethod
+    def get_retries_limit(first_sends_count: int):
+        """Retries allowed in a tick, so that they do not crowd out first-time sends."""
+        share_limit = int(first_sends_count * settings.MAILING_RETRY_SHARE)
+        return min(settings.MAILING_RETRY_MAX_PER_TICK, max(settings.MAILING_RETRY_MIN_PER_TICK, share_limit))
+
+
+class MailingLogWriter:
+    """
+    Buffers MailingLog rows and saves them with bulk_create
+    every MAILING_LOG_BATCH_SIZE rows or MAILING_LOG_FLUSH_INTERVAL seconds.
+    Used as a context manager, so the buffer is saved when
+    the worker stops, also after an error.
+    Rows keep the time they were built with, right after the send, not the flush time.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None):
+        self.batch_size = batch_size or settings.MAILING_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.MAILING_LOG_FLUSH_INTERVAL
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def save_logs(logs: list):
+        with transaction.atomic():
+            # counters go first, the stats row they lock orders the saves of a mailing
+            MailingStatsService.add_logs(logs)
+            MailingLog.objects.bulk_create(logs)
+            RetryService.schedule(logs)
+
+    def add(self, log: MailingLog):
+        self.buffer.append(log)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        logs, self.buffer = self.buffer, []
+        self.last_flush = time.monotonic()
+        if not logs:
+            return
+        try:
+            self.save_logs(logs)
+        except Exception:
+            # keep the results for the next flush
+            self.buffer = logs + self.buffer
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.flush()
+        except Exception:
+            lost = [(log.mailing_id, log.client_id, log.status) for log in self.buffer]
+            logging.exception(f"mailing logs were not saved: {lost}")
+            if exc_type is None:
+                raise
+
+
+class MailingLock:
+    """
+    Lease on a mailing in the DB, so only one tick processes it at a time.
+    A heartbeat thread renews the lease every third of MAILING_LEASE_SECONDS,
+    a lease of a killed tick expires and is taken over with its checkpoint:
+    the id of the last recipient whose chunk was dispatched.
+    """
+
+    def __init__(self, mailing: Mailing, lease_seconds: int = None):
+        self.mailing = mailing
+        self.lease = timedelta(seconds=lease_seconds or settings.MAILING_LEASE_SECONDS)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.acquired = False
+        self.checkpoint = None
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+        self.heartbeat = None
+
+    def get_leases(self):
+        return MailingLease.objects.filter(mailing=self.mailing)
+
+    def acquire(self):
         now = timezone.now()
+        MailingLease.objects.bulk_create(
+            [MailingLease(mailing=self.mailing, expires_at=now)], ignore_conflicts=True
+        )
+        self.acquired = bool(
+            self.get_leases()
+            .filter(Q(expires_at__lte=now) | Q(owner=self.owner))
+            .update(owner=self.owner, expires_at=now + self.lease)
+        )
+        if self.acquired:
+            self.checkpoint = self.get_leases().values_list("checkpoint", flat=True).first()
+            self.heartbeat = threading.Thread(target=self.renew_until_stopped, daemon=True)
+            self.heartbeat.start()
+        return self.acquired
+
+    def renew(self):
+        return bool(
+            self.get_leases().filter(owner=self.owner).update(expires_at=timezone.now() + self.lease)
+        )
+
+    def renew_until_stopped(self):
+        try:
+            while not self.stopped.wait(self.lease.total_seconds() / 3):
+                if not self.renew():
+                    logging.warning(f"lease of {self.mailing} was lost")
+                    self.lost.set()
+                    return
+        finally:
+            db_connection.close()
+
+    def save_checkpoint(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.get_leases().filter(owner=self.owner).update(checkpoint=checkpoint)
 
-        for mailing in mailings_list:
+    def release(self):
+        if not self.acquired:
+            return
+        self.stopped.set()
+        self.heartbeat.join()
+        self.get_leases().filter(owner=self.owner).update(owner="", expires_at=timezone.now())
+        self.acquired = False
 
-            if mailing.start_time <= now < mailing.end_time:
-                self.set_started(mailing)
-            elif mailing.end_time <= now:
-                self.set_finished(mailing)
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
 
 
 class MailService(MailingStatusesService):
     """
     Service class for email sending.
     Checking active mailings and run email sending.
-    Used in crontab schedule
+    Used by the run_dispatcher command
     """
 
     @staticmethod
     def get_started_mailings():
-        return Mailing.objects.filter(status=Mailing.STATUS_STARTED)
+        return Mailing.objects.filter(status=Mailing.STATUS_STARTED).select_related("period", "audience")
 
     @staticmethod
-    def send_one_email(mailing: Mailing, recipient: Client):
+    def send_one_email(
+        mailing: Mailing,
+        recipient: Recipient,
+        connection: MailConnection = None,
+        log_writer: MailingLogWriter = None,
+    ):
+        error_class = None
+        smtp_code = None
+        error_message = None
+        status = MailingLog.STATUS_ERROR
         try:
-            result = send_mail(
-                subject=mailing.message_title,
-                from_email=DEFAULT_FROM_EMAIL,
-                message=mailing.message_body,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-        except SMTPException as ex:
-            error_message = ex
-            status = MailingLog.STATUS_ERROR
+            message = PreparedEmailMessage(get_prepared_message(mailing), recipient)
+            if connection is None:
+                result = message.send()
+            else:
+                result = connection.get().send_messages([message])
+                connection.message_sent()
+        except (SMTPException, OSError) as ex:
+            if connection is not None:
+                connection.close()
+            get_rate_limiter().report_error(recipient.email, ex)
+            error_class = ex.__class__
+            smtp_code = get_smtp_code(ex)
+            error_message = str(ex)[:250]
+        except ValueError as ex:
+            # the message can not be built for this recipient (BadHeaderError and the like),
+            # the error is logged and the other recipients are sent
+            error_class = ex.__class__
+            error_message = str(ex)[:250]
         else:
-            error_message = None
             status = MailingLog.STATUS_SUCCESS if result else MailingLog.STATUS_FAILED
-        finally:
-            log_obj = MailingLog(
-                client=recipient,
+
+        log_obj = MailingLog(
+            client_id=recipient.id,
+            mailing=mailing,
+            status=status,
+            error_message=error_message,
+        )
+        log_obj.error_class = error_class
+        log_obj.smtp_code = smtp_code
+        if log_writer is None:
+            MailingLogWriter.save_logs([log_obj])
+        else:
+            log_writer.add(log_obj)
+
+    @staticmethod
+    def get_due_recipients_queryset(mailing: Mailing, now=None, exclude_queued=True):
+        """
+        Audience members without a log for this mailing newer than the mailing period,
+        one per normalized email.
+        Recipients waiting in the outbox are excluded unless exclude_queued is False.
+        """
+        recent_logs = MailingLog.objects.filter(
+            mailing=mailing,
+            client=OuterRef("pk"),
+            time__gt=(now or timezone.now()) - mailing.period.duration,
+        )
+        recipients = mailing.audience.recipients.exclude(Exists(recent_logs))
+        recipients = MailService.exclude_duplicates(mailing, recipients)
+
+        if exclude_queued:
+            queued = OutboxItem.objects.filter(
                 mailing=mailing,
-                status=status,
-                error_message=error_message,
+                client=OuterRef("pk"),
+                status__in=OutboxItem.ACTIVE_STATUSES,
+            )
+            recipients = recipients.exclude(Exists(queued))
+
+        return recipients
+
+    @staticmethod
+    def exclude_duplicates(mailing: Mailing, recipients):
+        """
+        Keeps one client per normalized email of the audience, the one with the lowest id,
+        so an address added several times gets one message.
+        """
+        duplicates = mailing.audience.recipients.filter(
+            normalized_email=OuterRef("normalized_email"),
+            pk__lt=OuterRef("pk"),
+        ).exclude(normalized_email="")
+        return recipients.exclude(Exists(duplicates))
+
+    @staticmethod
+    def log_duplicates(mailing: Mailing):
+        counts = mailing.audience.recipients.exclude(normalized_email="").aggregate(
+            total=Count("pk"), unique=Count("normalized_email", distinct=True)
+        )
+        skipped_count = counts["total"] - counts["unique"]
+        if skipped_count:
+            logging.info(f"duplicate emails skipped in {mailing}: {skipped_count}")
+
+    @staticmethod
+    def get_recipient_rows(queryset):
+        """Client fields needed for sending, without building model instances."""
+        return list(queryset.values_list(*RECIPIENT_FIELDS, named=True))
+
+    def get_due_recipients(self, mailing: Mailing, after: int = None, limit: int = None):
+        """Due recipients ordered by id, the chunk after the `after` id if given."""
+        if after is None:
+            self.log_duplicates(mailing)
+
+        queryset = self.get_due_recipients_queryset(mailing).order_by("pk")
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        if limit is not None:
+            queryset = queryset[:limit]
+
+        recipients = self.get_recipient_rows(queryset)
+        logging.info(f"due recipients of {mailing}: {len(recipients)}")
+
+        return recipients
+
+    @staticmethod
+    def get_workers_count(mailing: Mailing, recipients_count: int):
+        workers = mailing.workers or settings.MAILING_DISPATCH_WORKERS
+        return max(1, min(workers, recipients_count))
+
+    def send_emails(self, mailing: Mailing, recipients):
+        with MailConnection() as connection, MailingLogWriter() as log_writer:
+            for recipient in recipients:
+                self.send_one_email(mailing, recipient, connection, log_writer)
+
+    def send_emails_in_thread(self, mailing: Mailing, recipients):
+        """
+        Worker of the thread pool: uses its own SMTP connection and log writer,
+        closes its own DB connection when the work is done.
+        """
+        try:
+            self.send_emails(mailing, recipients)
+        finally:
+            db_connection.close()
+
+    def dispatch(self, mailing: Mailing, recipients: list):
+        workers = self.get_workers_count(mailing, len(recipients))
+        recipients = ThrottledRecipients(recipients)
+
+        if workers == 1:
+            self.send_emails(mailing, recipients)
+        else:
+            self.send_emails_in_pool(mailing, recipients, workers)
+
+        logging.info(f"rate limits: {get_rate_limiter().snapshot()}")
+
+    def send_emails_in_pool(self, mailing: Mailing, recipients: ThrottledRecipients, workers: int):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.send_emails_in_thread, mailing, recipients)
+                for _ in range(workers)
+            ]
+            for future in futures:
+                future.result()
+
+    def get_retry_recipients(self, mailing: Mailing, first_sends_count: int, since):
+        """
+        Recipients with a due retry, limited by RetryService.get_retries_limit.
+        Recipients which got a log or were queued since the tick start are skipped.
+        """
+        limit = RetryService.get_retries_limit(first_sends_count)
+        client_ids = set(RetryService.get_due_retries(mailing, limit))
+        if not client_ids:
+            return []
+
+        audience_members = mailing.audience.recipients.filter(pk__in=client_ids)
+        recipients = self.get_recipient_rows(
+            self.exclude_duplicates(mailing, audience_members).exclude(
+                Exists(MailingLog.objects.filter(mailing=mailing, client=OuterRef("pk"), time__gte=since))
+            ).exclude(
+                Exists(OutboxItem.objects.filter(
+                    mailing=mailing, client=OuterRef("pk"), status__in=OutboxItem.ACTIVE_STATUSES
+                ))
             )
-            log_obj.save()
+        )
+        left_audience = client_ids - set(audience_members.values_list("pk", flat=True))
+        if left_audience:
+            DeliveryRetry.objects.filter(mailing=mailing, client_id__in=left_audience).delete()
+
+        logging.info(f"retries of {mailing}: {len(recipients)}")
+        return recipients
+
+    def send_or_enqueue(self, mailing: Mailing, recipients: list, is_retry: bool = False):
+        if settings.MAILING_USE_OUTBOX:
+            OutboxService.enqueue(mailing, recipients, is_retry)
+        else:
+            self.dispatch(mailing, recipients)
 
     def process_mailing(self, mailing: Mailing):
+        """
+        Sends the due recipients by chunks under a lease on the mailing.
+        A tick killed halfway is resumed from the checkpoint by the next one.
+        """
+        started = timezone.now()
+
+        with MailingLock(mailing) as lock:
+            if not lock.acquired:
+                logging.info(f"{mailing} is processed by another tick")
+                return
 
-        recipients = mailing.audience.recipients.all()
-        logging.info(f"recipients: {recipients}")
+            first_sends_count = 0
+            while not lock.lost.is_set():
+                recipients = self.get_due_recipients(
+                    mailing, after=lock.checkpoint, limit=settings.MAILING_DISPATCH_CHUNK_SIZE
+                )
+                if not recipients:
+                    break
+                self.send_or_enqueue(mailing, recipients)
+                first_sends_count += len(recipients)
+                lock.save_checkpoint(recipients[-1].id)
 
-        for recipient in recipients:
-            last_log: MailingLog = recipient.logs.filter(mailing=mailing).last()
-            if not last_log or (timezone.now() - last_log.time >= mailing.period.duration):
-                self.send_one_email(mailing, recipient)
+            if lock.lost.is_set():
+                return
+            lock.save_checkpoint(None)
+
+            # retries go after the first-time sends
+            self.send_or_enqueue(
+                mailing, self.get_retry_recipients(mailing, first_sends_count, started), is_retry=True
+            )
 
     def process_mailing_list(self):
 
@@ -95,3 +581,659 @@ class MailService(MailingStatusesService):
 
         for mailing in mailings:
             self.process_mailing(mailing)
+
+
+class OutboxService:
+    """
+    Durable queue of pending (mailing, client) sends.
+    Workers on any host claim batches with SELECT ... FOR UPDATE SKIP LOCKED
+    (a conditional UPDATE is enough on SQLite, where writes are serialized),
+    send them through MailService and mark them done mailing by mailing.
+    A heartbeat renews the lease while the batch is sent,
+    items of a crashed worker are claimed again when their lease expires.
+    """
+
+    def __init__(self, worker_id: str = None, batch_size: int = None, lease_seconds: int = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size or settings.MAILING_OUTBOX_BATCH_SIZE
+        self.lease = timedelta(seconds=lease_seconds or settings.MAILING_OUTBOX_LEASE_SECONDS)
+        self.mail_service = MailService()
+
+    @staticmethod
+    def enqueue(mailing: Mailing, recipients: list, is_retry: bool = False):
+        items = [OutboxItem(mailing=mailing, client_id=recipient.id, is_retry=is_retry) for recipient in recipients]
+        OutboxItem.objects.bulk_create(items, batch_size=1000, ignore_conflicts=True)
+        logging.info(f"queued recipients of {mailing}: {len(items)}")
+
+    def claim_batch(self):
+        now = timezone.now()
+        lease_until = now + self.lease
+        claimable = Q(status=OutboxItem.STATUS_PENDING) | Q(
+            status=OutboxItem.STATUS_PROCESSING, lease_until__lt=now
+        )
+
+        with transaction.atomic():
+            candidates = OutboxItem.objects.filter(claimable).order_by("pk")
+            if db_connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            pks = list(candidates.values_list("pk", flat=True)[: self.batch_size])
+
+            OutboxItem.objects.filter(claimable, pk__in=pks).update(
+                status=OutboxItem.STATUS_PROCESSING,
+                worker=self.worker_id,
+                lease_until=lease_until,
+                attempts=F("attempts") + 1,
+            )
+
+        return list(
+            OutboxItem.objects.filter(pk__in=pks, worker=self.worker_id, lease_until=lease_until)
+            .select_related("mailing__period", "mailing__audience")
+        )
+
+    def complete(self, items: list):
+        OutboxItem.objects.filter(pk__in=[item.pk for item in items], worker=self.worker_id).update(
+            status=OutboxItem.STATUS_DONE,
+            lease_until=None,
+            done_at=timezone.now(),
+        )
+
+    def renew(self, items: list):
+        """Extends the lease of the claimed items which are not done yet."""
+        OutboxItem.objects.filter(
+            pk__in=[item.pk for item in items],
+            worker=self.worker_id,
+            status=OutboxItem.STATUS_PROCESSING,
+        ).update(lease_until=timezone.now() + self.lease)
+
+    def renew_until_stopped(self, items: list, stopped: threading.Event):
+        """Heartbeat: a rate limited batch may take longer than the lease."""
+        try:
+            while not stopped.wait(self.lease.total_seconds() / 3):
+                self.renew(items)
+        finally:
+            db_connection.close()
+
+    @staticmethod
+    def get_items_to_send(mailing: Mailing, items: list):
+        """
+        Items which were not sent since they were queued: an expired lease may hold
+        recipients which already got the email. Retries whose DeliveryRetry is gone
+        (delivered or left the audience meanwhile) are skipped too.
+        """
+        client_ids = [item.client_id for item in items]
+        last_sends = dict(
+            MailingLog.objects.filter(
+                mailing=mailing, client_id__in=client_ids, time__gte=min(item.created_at for item in items)
+            )
+            .values("client")
+            .annotate(last_time=Max("time"))
+            .order_by()
+            .values_list("client", "last_time")
+        )
+        retried = set()
+        if any(item.is_retry for item in items):
+            retried = set(
+                DeliveryRetry.objects.filter(mailing=mailing, client_id__in=client_ids)
+                .values_list("client_id", flat=True)
+            )
+        return [
+            item for item in items
+            if not (item.client_id in last_sends and last_sends[item.client_id] >= item.created_at)
+            and (not item.is_retry or item.client_id in retried)
+        ]
+
+    def send_batch(self, items: list):
+        """
+        Sends the items mailing by mailing. The logs of a mailing are flushed when its
+        dispatch returns, its items are marked done right then, not at the end of the batch.
+        """
+        by_mailing = {}
+        for item in items:
+            by_mailing.setdefault(item.mailing_id, (item.mailing, []))[1].append(item)
+
+        for mailing, mailing_items in by_mailing.values():
+            if mailing.status == Mailing.STATUS_STARTED:
+                client_ids = [item.client_id for item in self.get_items_to_send(mailing, mailing_items)]
+                members = mailing.audience.recipients.filter(pk__in=client_ids)
+                recipients = self.mail_service.get_recipient_rows(
+                    self.mail_service.exclude_duplicates(mailing, members).order_by("pk")
+                )
+                self.mail_service.dispatch(mailing, recipients)
+            self.complete(mailing_items)
+
+    def process_batch(self):
+        """Claims and sends one batch under a renewed lease. Returns the number of claimed items."""
+        items = self.claim_batch()
+        if not items:
+            return 0
+
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self.renew_until_stopped, args=(items, stopped), daemon=True)
+        heartbeat.start()
+        try:
+            self.send_batch(items)
+        finally:
+            stopped.set()
+            heartbeat.join()
+        return len(items)
+
+    @staticmethod
+    def purge_done(older_than: timedelta):
+        deleted, _ = OutboxItem.objects.filter(
+            status=OutboxItem.STATUS_DONE,
+            done_at__lt=timezone.now() - older_than,
+        ).delete()
+        return deleted
+
+
+class ClientMergeService:
+    """
+    Fills normalized_email of existing clients and merges clients of one creator
+    with the same normalized email into the one with the lowest id.
+    Audience memberships and mailing logs move to the kept client, outbox items
+    and retries of the merged clients are deleted with them.
+    Work is done in short transactions of batch_size rows, so it can run on a live database.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def backfill(self):
+        """Returns the number of clients with an updated normalized_email."""
+        clients = Client.objects
+        normalized = Lower(Trim("email"))
+        updated_count = 0
+        last_pk = 0
+        while True:
+            pks = list(clients.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:self.batch_size])
+            if not pks:
+                return updated_count
+            last_pk = pks[-1]
+            updated_count += (
+                clients.filter(pk__in=pks).exclude(normalized_email=normalized).update(normalized_email=normalized)
+            )
+
+    def get_duplicate_groups(self):
+        """(creator id, normalized email, id of the kept client) of every duplicated email."""
+        return list(
+            Client.objects.exclude(normalized_email="")
+            .values("creator", "normalized_email")
+            .annotate(keep_id=Min("pk"), clients_count=Count("pk"))
+            .filter(clients_count__gt=1)
+            .order_by()
+            .values_list("creator", "normalized_email", "keep_id")
+        )
+
+    @staticmethod
+    def merge_reached(keep_id: int, duplicate_ids: list):
+        """Keeps one first delivery per mailing for the kept client, the merged ones are not counted twice."""
+        reached = ReachedRecipient.objects.filter(client_id__in=[keep_id, *duplicate_ids])
+        rows = list(reached.values("mailing").annotate(count=Count("pk"), time=Min("time")).order_by())
+        for row in rows:
+            if row["count"] > 1:
+                MailingStats.objects.filter(mailing_id=row["mailing"]).update(
+                    recipients_count=F("recipients_count") - (row["count"] - 1)
+                )
+        reached.delete()
+        ReachedRecipient.objects.bulk_create(
+            [ReachedRecipient(mailing_id=row["mailing"], client_id=keep_id, time=row["time"]) for row in rows]
+        )
+
+    def merge_group(self, creator_id: int, normalized_email: str, keep_id: int):
+        duplicate_ids = list(
+            Client.objects.filter(creator_id=creator_id, normalized_email=normalized_email)
+            .exclude(pk=keep_id)
+            .values_list("pk", flat=True)
+        )
+        membership = Audience.recipients.through
+        audience_ids = (
+            membership.objects.filter(client_id__in=duplicate_ids)
+            .values_list("audience_id", flat=True)
+            .distinct()
+        )
+        membership.objects.bulk_create(
+            [membership(audience_id=audience_id, client_id=keep_id) for audience_id in audience_ids],
+            ignore_conflicts=True,
+        )
+        MailingLog.objects.filter(client_id__in=duplicate_ids).update(client_id=keep_id)
+        self.merge_reached(keep_id, duplicate_ids)
+        Client.objects.filter(pk__in=duplicate_ids).delete()
+        return len(duplicate_ids)
+
+    def merge(self):
+        """Returns the number of merged (deleted) clients."""
+        groups = self.get_duplicate_groups()
+        merged_count = 0
+        for start in range(0, len(groups), self.batch_size):
+            with transaction.atomic():
+                for group in groups[start:start + self.batch_size]:
+                    merged_count += self.merge_group(*group)
+        return merged_count
+
+    def run(self):
+        updated_count = self.backfill()
+        merged_count = self.merge()
+        if merged_count:
+            DashboardService.bump_version()
+        logging.info(f"clients normalized: {updated_count}, merged: {merged_count}")
+        return updated_count, merged_count
+
+
+class ClientImportService:
+    """
+    Streams clients of a creator from CSV with the columns email, first_name, last_name, note.
+    Rows are validated and upserted by batches, a client with the same normalized email
+    is updated. Only one batch is kept in memory whatever the file size.
+    Imported clients are added to the audience if it is given.
+    """
+
+    COLUMNS = ("email", "first_name", "last_name", "note")
+    REQUIRED_COLUMNS = ("email", "first_name", "last_name")
+    UPDATE_FIELDS = ("email", "first_name", "last_name", "note")
+
+    def __init__(self, creator, audience: Audience = None, batch_size: int = None, max_errors: int = None):
+        self.creator = creator
+        self.audience = audience
+        self.batch_size = batch_size or settings.MAILING_IMPORT_BATCH_SIZE
+        self.max_errors = settings.MAILING_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+
+        self.rows_count = 0
+        self.imported_count = 0
+        self.errors = []
+        self.errors_count = 0
+        self.on_error = None
+
+    def add_error(self, line: int, message: str):
+        self.errors_count += 1
+        if self.on_error:
+            self.on_error(line, message)
+        elif len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def build_client(self, line: int, row: dict):
+        values = {column: (row.get(column) or "").strip() for column in self.COLUMNS}
+        client = Client(creator=self.creator, **values)
+        client.note = client.note or None
+        try:
+            client.clean_fields(exclude=["creator", "normalized_email"])
+        except ValidationError as ex:
+            self.add_error(line, "; ".join(
+                f"{field}: {' '.join(messages)}" for field, messages in ex.message_dict.items()
+            ))
+            return None
+        return client
+
+    def save_batch(self, clients: dict):
+        """Upserts a batch of {normalized email: Client}."""
+        with transaction.atomic():
+            Client.objects.bulk_create(
+                clients.values(),
+                update_conflicts=True,
+                unique_fields=["creator", "normalized_email"],
+                update_fields=self.UPDATE_FIELDS,
+            )
+            if self.audience is not None:
+                # upserted rows do not get their ids back, the unique index finds them
+                client_ids = Client.objects.filter(
+                    creator=self.creator, normalized_email__in=list(clients)
+                ).values_list("pk", flat=True)
+                membership = Audience.recipients.through
+                membership.objects.bulk_create(
+                    [membership(audience=self.audience, client_id=client_id) for client_id in client_ids],
+                    ignore_conflicts=True,
+                )
+        self.imported_count += len(clients)
+
+    def run(self, file, on_progress=None, on_error=None):
+        """
+        Imports an open text file, on_progress(service) is called after every batch.
+        Row errors go to on_error(line, message) if given, else the first max_errors are kept.
+        Raises ValidationError when required columns are missing.
+        """
+        self.on_error = on_error
+        reader = csv.DictReader(file)
+        missing = [column for column in self.REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ValidationError(f"В файле нет колонок: {', '.join(missing)}")
+
+        batch = {}
+        for row in reader:
+            self.rows_count += 1
+            client = self.build_client(reader.line_num, row)
+            if client is None:
+                continue
+            # the last row of a repeated email wins, one upsert can not touch a row twice
+            batch[Client.normalize_email(client.email)] = client
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = {}
+                if on_progress:
+                    on_progress(self)
+
+        if batch:
+            self.save_batch(batch)
+        if on_progress:
+            on_progress(self)
+
+        DashboardService.invalidate(self.creator.pk)
+        logging.info(
+            f"clients import of {self.creator}: rows {self.rows_count}, "
+            f"imported {self.imported_count}, errors {self.errors_count}"
+        )
+        return self
+
+
+class MailingLogExportService:
+    """
+    Mailing logs as CSV or JSONL chunks for StreamingHttpResponse.
+    Rows are read with a server-side cursor as tuples, memory does not depend on the number of rows.
+    """
+
+    COLUMNS = ("time", "mailing_id", "mailing__name", "client_id", "client__email", "status", "error_message")
+    HEADER = ("time", "mailing_id", "mailing", "client_id", "email", "status", "error_message")
+
+    @staticmethod
+    def get_rows(queryset):
+        return (
+            queryset.order_by("pk")
+            .values_list(*MailingLogExportService.COLUMNS)
+            .iterator(chunk_size=settings.MAILING_EXPORT_CHUNK_SIZE)
+        )
+
+    @staticmethod
+    def iter_csv(rows):
+        """Yields one chunk per MAILING_EXPORT_CHUNK_SIZE rows, the header goes at once."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(MailingLogExportService.HEADER)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+        for number, row in enumerate(rows, 1):
+            writer.writerow((row[0].isoformat(), *row[1:]))
+            if number % settings.MAILING_EXPORT_CHUNK_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    def iter_jsonl(rows):
+        lines = []
+        for row in rows:
+            record = dict(zip(MailingLogExportService.HEADER, row))
+            record["time"] = record["time"].isoformat()
+            lines.append(json.dumps(record, ensure_ascii=False))
+            if len(lines) == settings.MAILING_EXPORT_CHUNK_SIZE:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+
+class MailingLogRetentionService:
+    """
+    Rolls MailingLog rows older than the retention up into daily MailingLogRollup rows
+    and deletes them. Every batch is its own short transaction, so the rollup and the
+    delete are consistent and no lock is held for long. Run one purge at a time.
+    """
+
+    def __init__(self, retention_days: int = None, batch_size: int = None):
+        self.retention = timedelta(days=retention_days or settings.MAILING_LOG_RETENTION_DAYS)
+        self.batch_size = batch_size or settings.MAILING_LOG_PURGE_BATCH_SIZE
+
+    def get_cutoff(self, now=None):
+        """
+        Logs newer than the longest period decide who is due,
+        so they are kept whatever the retention is.
+        """
+        longest_period = Periods.objects.aggregate(longest=Max("duration"))["longest"] or timedelta()
+        return (now or timezone.now()) - max(self.retention, longest_period)
+
+    @staticmethod
+    def add_to_rollups(logs):
+        counts = (
+            logs.annotate(date=TruncDate("time"))
+            .values("mailing_id", "date", "status")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+        counts = {(row["mailing_id"], row["date"], row["status"]): row["count"] for row in counts}
+
+        rollups = MailingLogRollup.objects.select_for_update().filter(
+            mailing_id__in={mailing_id for mailing_id, _, _ in counts},
+            date__in={date for _, date, _ in counts},
+        )
+        existing = {(rollup.mailing_id, rollup.date, rollup.status): rollup for rollup in rollups}
+
+        for key, rollup in existing.items():
+            rollup.count += counts.get(key, 0)
+        MailingLogRollup.objects.bulk_update(existing.values(), ["count"])
+        MailingLogRollup.objects.bulk_create([
+            MailingLogRollup(mailing_id=mailing_id, date=date, status=status, count=count)
+            for (mailing_id, date, status), count in counts.items()
+            if (mailing_id, date, status) not in existing
+        ])
+
+    def purge_batch(self, cutoff):
+        """Returns the number of deleted logs, 0 when nothing is left to purge."""
+        with transaction.atomic():
+            old_logs = MailingLog.objects.filter(time__lt=cutoff).order_by("time")
+            pks = list(old_logs.values_list("pk", flat=True)[:self.batch_size])
+            if not pks:
+                return 0
+            logs = MailingLog.objects.filter(pk__in=pks)
+            self.add_to_rollups(logs)
+            deleted, _ = logs.delete()
+        return deleted
+
+    def purge(self, now=None, pause: float = 0, on_progress=None):
+        """Purges all logs older than the cutoff, pausing between batches to leave room for dispatch."""
+        cutoff = self.get_cutoff(now)
+        purged_count = 0
+        while True:
+            deleted = self.purge_batch(cutoff)
+            if not deleted:
+                break
+            purged_count += deleted
+            if on_progress:
+                on_progress(purged_count)
+            if pause:
+                time.sleep(pause)
+
+        logging.info(f"mailing logs older than {cutoff} purged: {purged_count}")
+        return purged_count
+
+
+class MailingStatsService:
+    """
+    Keeps MailingStats up to date: add_logs() runs in the transaction which saves the logs,
+    rebuild() recounts them from the raw logs, the rollups of purged logs and the reached recipients.
+    Increments made while a rebuild runs may be lost, so run it when no mailing is sent.
+    """
+
+    STATUS_FIELDS = {
+        MailingLog.STATUS_SUCCESS: "success_count",
+        MailingLog.STATUS_FAILED: "fail_count",
+        MailingLog.STATUS_ERROR: "error_count",
+    }
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    @staticmethod
+    def add_logs(logs: list):
+        """Adds logs which are about to be saved to the counters of their mailings."""
+        by_mailing = {}
+        for log in logs:
+            by_mailing.setdefault(log.mailing_id, []).append(log)
+
+        for mailing_id, mailing_logs in by_mailing.items():
+            # the write goes first: a SQLite transaction which has read can not start writing
+            # while another thread writes
+            MailingStats.objects.bulk_create([MailingStats(mailing_id=mailing_id)], ignore_conflicts=True)
+
+            counts = Counter(log.status for log in mailing_logs)
+            last_send_time = max(log.time for log in mailing_logs)
+            # the update locks the stats row, so the reached recipients of a mailing are added one by one
+            MailingStats.objects.filter(mailing_id=mailing_id).update(
+                **{
+                    field: F(field) + counts[status]
+                    for status, field in MailingStatsService.STATUS_FIELDS.items()
+                    if counts[status]
+                },
+                last_send_time=Greatest(Coalesce("last_send_time", last_send_time), last_send_time),
+            )
+
+            reached = {}
+            for log in mailing_logs:
+                if log.status == MailingLog.STATUS_SUCCESS:
+                    reached[log.client_id] = min(log.time, reached.get(log.client_id, log.time))
+            for client_id in ReachedRecipient.objects.filter(
+                mailing_id=mailing_id, client_id__in=list(reached)
+            ).values_list("client_id", flat=True):
+                del reached[client_id]
+            if reached:
+                ReachedRecipient.objects.bulk_create(
+                    [
+                        ReachedRecipient(mailing_id=mailing_id, client_id=client_id, time=time)
+                        for client_id, time in reached.items()
+                    ],
+                    ignore_conflicts=True,
+                )
+                MailingStats.objects.filter(mailing_id=mailing_id).update(
+                    recipients_count=F("recipients_count") + len(reached)
+                )
+
+    def count_logs(self, mailing_ids: list):
+        status_counts = {
+            field: Count("pk", filter=Q(status=status)) for status, field in self.STATUS_FIELDS.items()
+        }
+        return {
+            row["mailing"]: row
+            for row in MailingLog.objects.filter(mailing_id__in=mailing_ids)
+            .values("mailing")
+            .annotate(
+                **status_counts,
+                last_send_time=Max("time"),
+            )
+            .order_by()
+        }
+
+    @staticmethod
+    def count_reached(mailing_ids: list):
+        return dict(
+            ReachedRecipient.objects.filter(mailing_id__in=mailing_ids)
+            .values("mailing")
+            .annotate(count=Count("pk"))
+            .order_by()
+            .values_list("mailing", "count")
+        )
+
+    def count_rollups(self, mailing_ids: list):
+        status_sums = {
+            field: Sum("count", filter=Q(status=status)) for status, field in self.STATUS_FIELDS.items()
+        }
+        return {
+            row["mailing"]: row
+            for row in MailingLogRollup.objects.filter(mailing_id__in=mailing_ids)
+            .values("mailing")
+            .annotate(**status_sums)
+            .order_by()
+        }
+
+    def rebuild(self, mailing_ids: list = None):
+        """Recounts the stats of the given mailings, of all mailings by default. Returns their number."""
+        if mailing_ids is None:
+            mailing_ids = list(Mailing.objects.values_list("pk", flat=True))
+
+        for start in range(0, len(mailing_ids), self.batch_size):
+            batch_ids = mailing_ids[start:start + self.batch_size]
+            raw_counts = self.count_logs(batch_ids)
+            rolled_counts = self.count_rollups(batch_ids)
+            reached_counts = self.count_reached(batch_ids)
+
+            stats = []
+            for mailing_id in batch_ids:
+                raw = raw_counts.get(mailing_id, {})
+                rolled = rolled_counts.get(mailing_id, {})
+                stats.append(MailingStats(
+                    mailing_id=mailing_id,
+                    **{
+                        field: (raw.get(field) or 0) + (rolled.get(field) or 0)
+                        for field in self.STATUS_FIELDS.values()
+                    },
+                    recipients_count=reached_counts.get(mailing_id, 0),
+                    last_send_time=raw.get("last_send_time"),
+                ))
+            MailingStats.objects.bulk_create(
+                stats,
+                update_conflicts=True,
+                unique_fields=["mailing"],
+                update_fields=[*self.STATUS_FIELDS.values(), "recipients_count", "last_send_time"],
+            )
+
+        logging.info(f"mailing stats rebuilt: {len(mailing_ids)}")
+        return len(mailing_ids)
+
+
+class DashboardService:
+    """
+    Counters of the index page, cached per user, or once for all managers.
+    Saving or deleting a Mailing or a Client drops the cached counters of its creator
+    and of managers, bulk changes bump the version, which outdates every cached payload.
+    Delivered emails change with every log write and are refreshed by the timeout.
+    """
+
+    VERSION_KEY = "dashboard_version"
+
+    @staticmethod
+    def get_cache_key(user_id: int = None):
+        return f"dashboard:{user_id or 'all'}"
+
+    @staticmethod
+    def count(mailings, clients):
+        counters = mailings.aggregate(
+            total_mailings=Count("pk"),
+            started_mailings=Count("pk", filter=Q(status=Mailing.STATUS_STARTED)),
+            waiting_for_start=Count("pk", filter=Q(status=Mailing.STATUS_CREATED)),
+            delivered_emails=Coalesce(Sum("stats__success_count"), 0),
+        )
+        counters["total_clients"] = clients.count()
+        return counters
+
+    @staticmethod
+    def get_counters(user, is_manager: bool):
+        if is_manager:
+            mailings, clients = Mailing.objects.all(), Client.objects.all()
+        else:
+            mailings, clients = user.mailing_set.all(), user.client_set.all()
+
+        if not settings.CACHE_ENABLED:
+            return DashboardService.count(mailings, clients)
+
+        key = DashboardService.get_cache_key(None if is_manager else user.pk)
+        cached = cache.get_many([key, DashboardService.VERSION_KEY])
+        version = cached.get(DashboardService.VERSION_KEY, 0)
+        payload = cached.get(key)
+        if payload is not None and payload["version"] == version:
+            return payload["counters"]
+
+        counters = DashboardService.count(mailings, clients)
+        cache.set(key, {"version": version, "counters": counters}, settings.MAILING_DASHBOARD_CACHE_TIMEOUT)
+        return counters
+
+    @staticmethod
+    def invalidate(creator_id: int):
+        if settings.CACHE_ENABLED:
+            cache.delete_many([DashboardService.get_cache_key(creator_id), DashboardService.get_cache_key()])
+
+    @staticmethod
+    def bump_version():
+        if not settings.CACHE_ENABLED:
+            return
+        try:
+            cache.incr(DashboardService.VERSION_KEY)
+        except ValueError:
+            cache.set(DashboardService.VERSION_KEY, 1, None)
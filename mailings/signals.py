@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+from .models import Client, Mailing
+from .services import DashboardService
+
+
+# no delete receivers on Client and Mailing: they would turn off the fast delete
+# of the cascades, the delete views invalidate the counters themselves
+@receiver(post_save, sender=Mailing)
+@receiver(post_save, sender=Client)
+def invalidate_dashboard(sender, instance, **kwargs):
+    DashboardService.invalidate(instance.creator_id)
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_dashboards_of_user(sender, instance, **kwargs):
+    # mailings and clients of the user go away with a cascade
+    DashboardService.bump_version()
@@ -1,3 +1,6 @@
+import asyncio
+
+from .async_services import AsyncMailService
 from .services import MailService
 
 mail_service = MailService()
@@ -8,3 +11,10 @@ def check_mailing_list():
     Using MailService to process active mailings.
     """
     mail_service.process_mailing_list()
+
+
+def check_mailing_list_async():
+    """
+    Using AsyncMailService to process active mailings.
+    """
+    asyncio.run(AsyncMailService().process_mailing_list())
@@ -0,0 +1,258 @@
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users.models import User
+from .forms import ClientForm
+from .messages import Recipient
+from .models import Audience, Client, DeliveryRetry, Mailing, MailingLog, MailingStats, OutboxItem, Periods
+from .rate_limits import get_smtp_code
+from .scheduler import DispatchSchedule
+from .services import (
+    MailingLogRetentionService,
+    MailingLogWriter,
+    MailingStatsService,
+    MailService,
+    OutboxService,
+    RetryService,
+)
+
+
+class DispatchScheduleDueTimeTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        user = User.objects.create(email="owner@example.com")
+        self.period = Periods.objects.create(name="Раз в день", duration=timedelta(days=1))
+        self.audience = Audience.objects.create(name="Аудитория", creator=user)
+        self.member = Client.objects.create(
+            first_name="Иван", last_name="Иванов", email="member@example.com", creator=user
+        )
+        self.left = Client.objects.create(
+            first_name="Петр", last_name="Петров", email="left@example.com", creator=user
+        )
+        self.audience.recipients.add(self.member, self.left)
+        self.mailing = Mailing.objects.create(
+            name="Рассылка",
+            status=Mailing.STATUS_STARTED,
+            period=self.period,
+            audience=self.audience,
+            start_time=self.now - timedelta(days=3),
+            end_time=self.now + timedelta(days=3),
+            message_title="Тема",
+            message_body="Текст",
+            creator=user,
+        )
+
+    def add_log(self, client, time):
+        MailingLog.objects.create(
+            mailing=self.mailing, client=client, status=MailingLog.STATUS_SUCCESS, time=time
+        )
+
+    def test_client_removed_from_audience_is_not_due(self):
+        # the client who left was sent long ago and would be overdue if counted
+        self.add_log(self.left, self.now - timedelta(days=2))
+        self.add_log(self.member, self.now - timedelta(hours=1))
+        self.audience.recipients.remove(self.left)
+
+        due_time = DispatchSchedule.get_due_time(self.mailing, self.now)
+
+        self.assertEqual(due_time, self.now - timedelta(hours=1) + self.period.duration)
+
+    def test_client_without_log_is_due_now(self):
+        self.add_log(self.member, self.now - timedelta(hours=1))
+
+        self.assertEqual(DispatchSchedule.get_due_time(self.mailing, self.now), self.now)
+
+    def test_nothing_due_without_members(self):
+        self.audience.recipients.clear()
+
+        self.assertIsNone(DispatchSchedule.get_due_time(self.mailing, self.now))
+
+
+class RetryPolicyTest(TestCase):
+
+    @staticmethod
+    def get_policy(code):
+        ex = SMTPRecipientsRefused({"client@example.com": (code, b"refused")})
+        return RetryService.get_policy(ex.__class__, get_smtp_code(ex))
+
+    def test_temporary_recipient_refusal_is_retried(self):
+        for code in (450, 451, 452):
+            self.assertIsNotNone(self.get_policy(code))
+
+    def test_permanent_recipient_refusal_is_final(self):
+        self.assertIsNone(self.get_policy(550))
+
+
+class SendOneEmailTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        user = User.objects.create(email="owner@example.com")
+        self.audience = Audience.objects.create(name="Аудитория", creator=user)
+        self.mailing = Mailing.objects.create(
+            name="Рассылка",
+            status=Mailing.STATUS_STARTED,
+            period=Periods.objects.create(name="Раз в день", duration=timedelta(days=1)),
+            audience=self.audience,
+            start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(days=1),
+            message_title="Привет, {{ first_name }}",
+            message_body="Здравствуйте, {{ full_name }}!",
+            creator=user,
+            # the sends stay in the test thread and its transaction
+            workers=1,
+        )
+        self.creator = user
+
+    def add_client(self, first_name, email):
+        client = Client.objects.create(first_name=first_name, last_name="Иванов", email=email, creator=self.creator)
+        self.audience.recipients.add(client)
+        return client
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", MAILING_RATE_LIMITS={}, MAILING_USE_OUTBOX=False
+    )
+    def test_line_break_in_merge_field_does_not_block_the_mailing(self):
+        self.add_client("Анна\nX", "anna@example.com")
+        self.add_client("Петр", "petr@example.com")
+
+        MailService().process_mailing(self.mailing)
+
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ["Привет, Анна X", "Привет, Петр"])
+        self.assertEqual(
+            MailingLog.objects.filter(mailing=self.mailing, status=MailingLog.STATUS_SUCCESS).count(), 2
+        )
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_message_which_can_not_be_built_is_logged_as_error(self):
+        client = self.add_client("Анна", "anna@example.com")
+        recipient = Recipient(client.pk, "anna@example.com\nBcc: x@example.com", "Анна", "Иванов", None)
+
+        MailService.send_one_email(self.mailing, recipient)
+
+        log = MailingLog.objects.get(mailing=self.mailing, client=client)
+        self.assertEqual(log.status, MailingLog.STATUS_ERROR)
+        self.assertFalse(DeliveryRetry.objects.filter(mailing=self.mailing).exists())
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", MAILING_RATE_LIMITS={}, MAILING_USE_OUTBOX=True
+)
+class OutboxRetryTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        user = User.objects.create(email="owner@example.com")
+        audience = Audience.objects.create(name="Аудитория", creator=user)
+        self.client_obj = Client.objects.create(
+            first_name="Анна", last_name="Иванова", email="anna@example.com", creator=user
+        )
+        audience.recipients.add(self.client_obj)
+        self.mailing = Mailing.objects.create(
+            name="Рассылка",
+            status=Mailing.STATUS_STARTED,
+            period=Periods.objects.create(name="Раз в день", duration=timedelta(days=1)),
+            audience=audience,
+            start_time=now - timedelta(hours=2),
+            end_time=now + timedelta(days=1),
+            message_title="Тема",
+            message_body="Текст",
+            creator=user,
+            workers=1,
+        )
+        # the first send failed an hour ago, inside the period, and its retry is due
+        MailingLog.objects.create(
+            mailing=self.mailing, client=self.client_obj, status=MailingLog.STATUS_ERROR,
+            time=now - timedelta(hours=1),
+        )
+        DeliveryRetry.objects.create(
+            mailing=self.mailing, client=self.client_obj, attempts=1, next_retry_at=now - timedelta(minutes=1)
+        )
+
+    def test_queued_retry_is_sent_by_the_worker(self):
+        MailService().process_mailing(self.mailing)
+        self.assertTrue(OutboxItem.objects.get(mailing=self.mailing).is_retry)
+        # the queued retry does not keep the mailing due
+        now = timezone.now()
+        self.assertGreater(DispatchSchedule.get_due_time(self.mailing, now), now)
+
+        OutboxService(worker_id="test").process_batch()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(DeliveryRetry.objects.filter(mailing=self.mailing).exists())
+        self.assertEqual(OutboxItem.objects.get(mailing=self.mailing).status, OutboxItem.STATUS_DONE)
+
+    def test_item_sent_since_it_was_queued_is_not_sent_again(self):
+        MailService().process_mailing(self.mailing)
+        MailingLog.objects.create(mailing=self.mailing, client=self.client_obj, status=MailingLog.STATUS_SUCCESS)
+
+        OutboxService(worker_id="test").process_batch()
+
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ClientEmailUniquenessTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email="owner@example.com", is_staff=True, is_superuser=True)
+        Client.objects.create(first_name="Анна", last_name="Иванова", email="dup@example.com", creator=self.user)
+
+    def test_admin_rejects_email_which_differs_in_case(self):
+        self.client.force_login(self.user)
+
+        response = self.client.post(
+            "/admin/mailings/client/add/",
+            {"first_name": "Анна", "last_name": "Иванова", "email": "DUP@example.com", "creator": self.user.pk},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("email", response.context["adminform"].form.errors)
+        self.assertEqual(Client.objects.count(), 1)
+
+    def test_client_form_rejects_email_which_differs_in_case(self):
+        form = ClientForm(self.user, {"first_name": "Анна", "last_name": "Иванова", "email": " Dup@Example.com"})
+
+        self.assertIn("email", form.errors)
+
+
+class MailingStatsReachedTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        user = User.objects.create(email="owner@example.com")
+        audience = Audience.objects.create(name="Аудитория", creator=user)
+        self.client_obj = Client.objects.create(
+            first_name="Анна", last_name="Иванова", email="anna@example.com", creator=user
+        )
+        audience.recipients.add(self.client_obj)
+        self.mailing = Mailing.objects.create(
+            name="Рассылка",
+            status=Mailing.STATUS_STARTED,
+            period=Periods.objects.create(name="Раз в день", duration=timedelta(days=1)),
+            audience=audience,
+            start_time=now - timedelta(days=60),
+            end_time=now + timedelta(days=1),
+            message_title="Тема",
+            message_body="Текст",
+            creator=user,
+        )
+
+    def save_success(self, time):
+        MailingLogWriter.save_logs([
+            MailingLog(mailing=self.mailing, client=self.client_obj, status=MailingLog.STATUS_SUCCESS, time=time)
+        ])
+
+    def test_client_reached_before_the_purge_is_counted_once(self):
+        now = timezone.now()
+        self.save_success(now - timedelta(days=50))
+        MailingLogRetentionService(retention_days=30).purge(now)
+        self.save_success(now)
+
+        self.assertEqual(MailingStats.objects.get(mailing=self.mailing).recipients_count, 1)
+        MailingStatsService().rebuild([self.mailing.pk])
+        self.assertEqual(MailingStats.objects.get(mailing=self.mailing).recipients_count, 1)
@@ -17,6 +17,7 @@ urlpatterns = [
     path('mailings/<int:pk>/', views.MailingDetailView.as_view(), name='mailing_detail'),
 
     path('clients/create/', views.ClientCreateView.as_view(), name='client_create'),
+    path('clients/import/', views.ClientImportView.as_view(), name='client_import'),
     path('clients/<int:pk>/edit/', views.ClientUpdateView.as_view(), name='client_edit'),
     path('clients/<int:pk>/delete/', views.ClientDeleteView.as_view(), name='client_delete'),
     path('clients/', views.ClientListView.as_view(), name='client_list'),
@@ -28,4 +29,5 @@ urlpatterns = [
     path('mailings/periods/', views.PeriodsListView.as_view(), name='periods_list'),
 
     path('mailing_logs/', views.MailingLogListView.as_view(), name='mailing_log_list'),
+    path('mailing_logs/export/', views.MailingLogExportView.as_view(), name='mailing_log_export'),
 ]
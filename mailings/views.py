@@ -1,4 +1,5 @@
-import random
+import io
+from datetime import datetime
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
@@ -7,9 +8,11 @@ from django.contrib.auth.mixins import (
     LoginRequiredMixin,
     PermissionRequiredMixin,
 )
-from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
 from django.forms import SplitDateTimeField
 from django.forms.widgets import SplitDateTimeWidget
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -19,12 +22,15 @@ from django.views.generic import (
     DeleteView,
     TemplateView,
     DetailView,
+    FormView,
+    View,
 )
 
-from blog.models import Article
+from blog.services import get_random_articles
 from users.services import manager_or_superuser
-from .forms import AudienceForm
-from .models import Mailing, Client, Periods, MailingLog, Audience
+from .forms import AudienceForm, ClientForm, ClientImportForm, MailingLogFilterForm
+from .models import Mailing, Client, Periods, MailingLog, Audience, MailingStats
+from .services import ClientImportService, DashboardService, MailingLogExportService
 
 DATETIME_WIDGET = SplitDateTimeWidget(
     date_attrs={"type": "date", "class": "my-2"}, time_attrs={"type": "time"}
@@ -41,78 +47,99 @@ class IndexView(LoginRequiredMixin, TemplateView):
         user = self.request.user
         context_data = super().get_context_data(**kwargs)
 
-        if manager_or_superuser(user):
-            all_mailings = Mailing.objects
-            user_clients = Client.objects
-        else:
-            all_mailings = user.mailing_set
-            user_clients = user.client_set
-
-        if settings.CACHE_ENABLED:
-            key_random_articles = "index_page_random_articles"
-            random_articles = cache.get(key_random_articles)
-
-            if random_articles is None:
-                total_articles = Article.objects.filter(is_published=True).count()
-                random_articles_limit = total_articles if total_articles <= 3 else 3
-                random_articles = random.sample(
-                    list(Article.objects.filter(is_published=True)),
-                    random_articles_limit,
-                )
-                cache.set(key_random_articles, random_articles)
-        else:
-            total_articles = Article.objects.filter(is_published=True).count()
-            random_articles_limit = total_articles if total_articles <= 3 else 3
-            random_articles = random.sample(
-                list(Article.objects.filter(is_published=True)), random_articles_limit
-            )
-
-        total_mailings = all_mailings.count()
-        started_mailings = all_mailings.filter(status="started").count()
-        waiting_for_start = all_mailings.filter(status="created").count()
-        total_clients = user_clients.count()
-
-        context_data["total_mailings"] = total_mailings
-        context_data["started_mailings"] = started_mailings
-        context_data["waiting_for_start"] = waiting_for_start
-        context_data["total_clients"] = total_clients
-        context_data["random_articles"] = random_articles
+        context_data.update(DashboardService.get_counters(user, manager_or_superuser(user)))
+        context_data["random_articles"] = get_random_articles(3)
 
         return context_data
 
 
 class MailingListView(LoginRequiredMixin, ListView):
+    """
+    One page of mailings of the selected status tab. The tab counters come from
+    one query grouped by status, which also gives the paginator its row count.
+    """
+
     model = Mailing
+    ordering = ("-pk",)
+    status_tabs = (
+        (None, "Все"),
+        (Mailing.STATUS_STARTED, "Запущены"),
+        (Mailing.STATUS_CREATED, "Созданы"),
+        (Mailing.STATUS_FINISHED, "Завершены"),
+    )
 
     extra_context = {
         "title": "Рассылки",
         "nbar": "mailings",
     }
 
-    def get_queryset(self, *args, **kwargs):
-        queryset = super().get_queryset()
+    def get_paginate_by(self, queryset):
+        return settings.MAILING_LIST_PAGE_SIZE
+
+    def get_user_mailings(self):
         user = self.request.user
+        if manager_or_superuser(user):
+            return Mailing.objects.all()
+        return Mailing.objects.filter(creator=user)
 
-        if not manager_or_superuser(user):
-            queryset = queryset.filter(creator=user)
+    def get_status(self):
+        status = self.request.GET.get("status")
+        return status if status in dict(Mailing.STATUSES) else None
 
+    def get_status_counts(self):
+        if not hasattr(self, "status_counts"):
+            self.status_counts = dict(
+                self.get_user_mailings().order_by().values_list("status").annotate(count=Count("pk"))
+            )
+        return self.status_counts
+
+    def get_queryset(self):
+        queryset = self.get_user_mailings().select_related("period", "stats").order_by(*self.ordering)
+        status = self.get_status()
+        if status:
+            queryset = queryset.filter(status=status)
         return queryset
 
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        status_counts = self.get_status_counts()
+        status = self.get_status()
+        paginator.count = status_counts.get(status, 0) if status else sum(status_counts.values())
+        return paginator
+
     def get_context_data(self, *args, **kwargs):
         context_data = super().get_context_data(*args, **kwargs)
-        all_mailings = self.get_queryset()
+        status_counts = self.get_status_counts()
+        current_status = self.get_status()
+
+        context_data["status_tabs"] = [
+            {
+                "status": status or "",
+                "label": label,
+                "count": status_counts.get(status, 0) if status else sum(status_counts.values()),
+                "active": status == current_status,
+            }
+            for status, label in self.status_tabs
+        ]
+        context_data["current_status"] = current_status or ""
+        page = context_data["page_obj"]
+        context_data["page_range"] = page.paginator.get_elided_page_range(page.number)
+        return context_data
 
-        started_mailings = all_mailings.filter(status="started")
-        created_mailings = all_mailings.filter(status="created")
-        finished_mailings = all_mailings.filter(status="finished")
 
-        context_data["created_mailings"] = created_mailings
-        context_data["started_mailings"] = started_mailings
-        context_data["finished_mailings"] = finished_mailings
-        return context_data
+class InvalidateDashboardMixin:
+    """
+    Drops the index page counters of the deleted object's creator. Deletes have no signal
+    receivers, so cascades from users and audiences keep Django's fast delete.
+    """
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        DashboardService.invalidate(self.object.creator_id)
+        return response
 
 
-class MailingDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
+class MailingDeleteView(LoginRequiredMixin, PermissionRequiredMixin, InvalidateDashboardMixin, DeleteView):
     model = Mailing
     permission_required = "mailings.delete_mailing"
     success_url = reverse_lazy("mailings:mailings_list")
@@ -201,6 +228,7 @@ class MailingDetailView(
     LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin, DetailView
 ):
     model = Mailing
+    queryset = Mailing.objects.select_related("stats")
     permission_required = "mailings.view_mailing"
 
     extra_context = {
@@ -210,6 +238,10 @@ class MailingDetailView(
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
         context_data["title"] = f"Рассылка {self.object.name}"
+        try:
+            context_data["stats"] = self.object.stats
+        except MailingStats.DoesNotExist:
+            context_data["stats"] = MailingStats(mailing=self.object)
         return context_data
 
     def test_func(self):
@@ -221,11 +253,16 @@ class MailingDetailView(
 class ClientCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     model = Client
     permission_required = "mailings.add_client"
-    fields = ("first_name", "last_name", "email", "note")
+    form_class = ClientForm
     success_url = reverse_lazy("mailings:client_list")
 
     extra_context = {"title": "Добавить получателя", "nbar": "clients"}
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         user = self.request.user
         client = form.save(commit=False)
@@ -239,17 +276,22 @@ class ClientUpdateView(
 ):
     model = Client
     permission_required = "mailings.change_client"
-    fields = ("first_name", "last_name", "email", "note")
+    form_class = ClientForm
     success_url = reverse_lazy("mailings:client_list")
     extra_context = {"title": "Изменить данные получателя", "nbar": "clients"}
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
     def test_func(self):
         client = self.get_object()
         return client.creator == self.request.user or self.request.user.is_superuser
 
 
 class ClientDeleteView(
-    LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin, DeleteView
+    LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin, InvalidateDashboardMixin, DeleteView
 ):
     model = Client
     permission_required = "mailings.delete_client"
@@ -264,6 +306,32 @@ class ClientDeleteView(
         return client.creator == self.request.user or self.request.user.is_superuser
 
 
+class ClientImportView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+    form_class = ClientImportForm
+    permission_required = "mailings.add_client"
+    template_name = "mailings/client_import.html"
+    extra_context = {"title": "Импорт получателей", "nbar": "clients"}
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        service = ClientImportService(self.request.user, form.cleaned_data["audience"])
+        # the upload is streamed from the temporary file, not read into memory
+        file = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig", newline="")
+        try:
+            service.run(file)
+        except (ValidationError, UnicodeDecodeError) as ex:
+            form.add_error("file", ex if isinstance(ex, ValidationError) else "Файл должен быть в кодировке UTF-8")
+            return self.form_invalid(form)
+        finally:
+            file.detach()
+
+        return self.render_to_response(self.get_context_data(form=form, result=service))
+
+
 class ClientListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Client
     permission_required = "mailings.view_client"
@@ -300,42 +368,102 @@ class PeriodsListView(LoginRequiredMixin, ListView):
     }
 
 
-class MailingLogListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class MailingLogAccessMixin:
+    """Mailings and logs the user may see: all for managers, own ones for the others."""
+
+    def get_user_mailings(self):
+        user = self.request.user
+        if manager_or_superuser(user):
+            return Mailing.objects.all()
+        return Mailing.objects.filter(creator=user)
+
+    def get_user_logs(self):
+        user = self.request.user
+        if manager_or_superuser(user):
+            return MailingLog.objects.all()
+        return MailingLog.objects.filter(mailing__creator=user)
+
+
+class MailingLogListView(LoginRequiredMixin, PermissionRequiredMixin, MailingLogAccessMixin, ListView):
+    """
+    Logs newest first with keyset pagination: the `after` GET parameter holds the (time, id)
+    of the last row of the previous page, so any page costs one index range scan.
+    """
+
     model = MailingLog
     permission_required = "mailings.view_mailinglog"
+    template_name = "mailings/mailinglog_list.html"
+
+    @staticmethod
+    def make_cursor(log: MailingLog):
+        return f"{log.time.isoformat()}_{log.pk}"
+
+    @staticmethod
+    def parse_cursor(cursor: str):
+        """Returns (time, id) or None for a missing or broken cursor."""
+        try:
+            time, pk = cursor.rsplit("_", 1)
+            return datetime.fromisoformat(time), int(pk)
+        except ValueError:
+            return None
+
+    def get_filter_form(self):
+        if not hasattr(self, "filter_form"):
+            self.filter_form = MailingLogFilterForm(self.get_user_mailings(), self.request.GET)
+        return self.filter_form
+
+    def get_queryset(self):
+        queryset = self.get_user_logs()
+        form = self.get_filter_form()
+        if form.is_valid():
+            queryset = form.filter_queryset(queryset)
+
+        cursor = self.parse_cursor(self.request.GET.get("after", ""))
+        if cursor:
+            time, pk = cursor
+            queryset = queryset.filter(Q(time__lt=time) | Q(time=time, pk__lt=pk))
+
+        page_size = settings.MAILING_LOG_PAGE_SIZE
+        logs = list(queryset.select_related("client", "mailing").order_by("-time", "-pk")[:page_size + 1])
+        self.next_cursor = self.make_cursor(logs[page_size - 1]) if len(logs) > page_size else None
+        return logs[:page_size]
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context_data = super().get_context_data(**kwargs)
 
-        user = self.request.user
-        if manager_or_superuser(user):
-            context_data["mailings"] = Mailing.objects.all()
-        else:
-            context_data["mailings"] = Mailing.objects.filter(creator=user)
+        query = self.request.GET.copy()
+        query.pop("after", None)
+        context_data["filter_query"] = query.urlencode()
+        if self.next_cursor:
+            query["after"] = self.next_cursor
+            context_data["next_page_query"] = query.urlencode()
 
+        context_data["filter_form"] = self.get_filter_form()
+        context_data["is_first_page"] = "after" not in self.request.GET
         context_data["title"] = "Логи"
         context_data["nbar"] = "logs"
-        context_data["selected_mailing_pk"] = int(self.request.POST.get("mailing", 0))
 
         return context_data
 
-    def get_queryset(self):
-        mailing_pk = self.request.POST.get("mailing", 0)
 
-        user = self.request.user
+class MailingLogExportView(LoginRequiredMixin, PermissionRequiredMixin, MailingLogAccessMixin, View):
+    permission_required = "mailings.view_mailinglog"
+    formats = {
+        "csv": ("text/csv; charset=utf-8", MailingLogExportService.iter_csv),
+        "jsonl": ("application/x-ndjson; charset=utf-8", MailingLogExportService.iter_jsonl),
+    }
 
-        if manager_or_superuser(user):
-            all_objects = self.model.objects.all()
-            mailing_pk_list = list(Mailing.objects.values_list("pk", flat=True))
-        else:
-            all_objects = self.model.objects.filter(mailing__creator=user)
-            mailing_pk_list = list(user.mailing_set.values_list("pk", flat=True))
-        if int(mailing_pk) in mailing_pk_list:
-            return all_objects.filter(mailing_id=mailing_pk)
-        return all_objects
-
-    def post(self, request):
-        return self.get(request)
+    def get(self, request):
+        export_format = request.GET.get("format", "csv")
+        form = MailingLogFilterForm(self.get_user_mailings(), request.GET)
+        if export_format not in self.formats or not form.is_valid():
+            return HttpResponseBadRequest("Неверные параметры выгрузки")
+
+        content_type, iter_content = self.formats[export_format]
+        rows = MailingLogExportService.get_rows(form.filter_queryset(self.get_user_logs()))
+        response = StreamingHttpResponse(iter_content(rows), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="mailing_logs.{export_format}"'
+        return response
 
 
 class AudienceListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
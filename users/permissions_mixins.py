@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 
 from django.contrib.auth.mixins import UserPassesTestMixin
 
+from users.services import in_group
+
 
 class GroupRequiredMixin(UserPassesTestMixin, ABC):
 
@@ -11,9 +13,7 @@ class GroupRequiredMixin(UserPassesTestMixin, ABC):
         pass
 
     def test_func(self):
-        if self.request.user.groups.filter(name=self.group_name).exists() | self.request.user.is_superuser:
-            return True
-        return False
+        return in_group(self.request.user, self.group_name)
 
 
 class ManagerRequiredMixin(GroupRequiredMixin):
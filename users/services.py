@@ -1,5 +1,9 @@
+import time
+
+from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 
@@ -30,5 +34,65 @@ def send_verify_mail(user, request):
     activation_email.send()
 
 
+def get_groups_version_key(user_id):
+    return f"users:groups_version:{user_id}"
+
+
+def get_groups_version(user_id):
+    """
+    Version of the user groups in the cache. A missing version, also an evicted one,
+    is seeded with the current time, so entries cached under older versions are never read again.
+    """
+    key = get_groups_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_group_names(user):
+    """
+    Names of the user groups, loaded once per request: they are kept on the user object,
+    which lives as long as the request, and in the cache under the version of the user groups.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    group_names = getattr(user, "_group_names_cache", None)
+    if group_names is not None:
+        return group_names
+
+    if settings.CACHE_ENABLED:
+        version = get_groups_version(user.pk)
+        key = f"users:groups:{user.pk}:{version}"
+        group_names = cache.get(key)
+        if group_names is None:
+            group_names = frozenset(user.groups.values_list("name", flat=True))
+            cache.set(key, group_names, settings.USERS_GROUPS_CACHE_TIMEOUT)
+    else:
+        group_names = frozenset(user.groups.values_list("name", flat=True))
+
+    user._group_names_cache = group_names
+    return group_names
+
+
+def invalidate_group_names(user_ids):
+    """Bumps the groups version of the users, their cached group names are not read any more."""
+    if not settings.CACHE_ENABLED:
+        return
+    for user_id in user_ids:
+        key = get_groups_version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def in_group(user, group_name):
+    return user.is_superuser or group_name in get_group_names(user)
+
+
 def manager_or_superuser(user):
-    return user.groups.filter(name='Managers').exists() or user.is_superuser
+    return in_group(user, 'Managers')
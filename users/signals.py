@@ -0,0 +1,27 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+from users.services import invalidate_group_names
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            # user.groups.add(...): the user object itself must not keep the old names
+            instance._group_names_cache = None
+            invalidate_group_names([instance.pk])
+    elif action == "pre_clear":
+        # group.user_set.clear(): pk_set is empty, the members are known before the clear only
+        invalidate_group_names(instance.user_set.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        invalidate_group_names(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_group_names(instance.user_set.values_list("pk", flat=True))